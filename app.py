@@ -1,15 +1,25 @@
 import streamlit as st
-import openai
 import os
 from datetime import datetime
 import json
-import PyPDF2
 import io
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.schema import Document
-import re
+import time
+import asyncio
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dsm_index import DSM_PDF_PATH, DSM_TOP_K, EMBEDDING_BACKEND, INDEX_TYPE, get_dsm_index
+from batch_transform import BATCH_CONCURRENCY, load_rows, run_batch
+from kb_build import KB_AUTOBUILD, describe_progress, get_kb_builder
+from long_document import DOCUMENT_TYPES, combine_facts, iter_document_lines, map_segments, split_segments
+from metrics import METRICS_ENABLED, get_metrics, record_cache, record_usage, stage
+from openai_client import call_with_retries, get_openai_client
+from note_history import SESSION_HISTORY_PATH, NoteHistory, get_note_history
+from note_transform import (NOTE_MODEL, NOTE_PROMPT_VERSION, NOTE_TEMPERATURE, OUTPUT_STYLES, TRUNCATED_FINISH_REASON,
+                            NoteTruncatedError, assemble_note_prompt, assemble_section_prompts, widen_output_budget)
+from pdf_extract import iter_pdf_pages
+from response_cache import get_response_cache, response_cache_key
 
 # Page configuration
 st.set_page_config(
@@ -97,69 +107,61 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Minimum seconds between redraws while a note is streaming
+STREAM_RENDER_INTERVAL = 0.05
+# Default for the "Generate sections in parallel" option
+PARALLEL_SECTIONS = os.environ.get("NOTE_PARALLEL_SECTIONS", "0") == "1"
+SECTIONS_CACHE_MODE = "sections"
+BATCH_OUTPUT_DIR = ".batch_runs"
+HISTORY_PAGE_SIZE = 10
+# Seconds between sidebar polls of a background knowledge-base build
+KB_PROGRESS_INTERVAL = 1.0
+STAGE_LABELS = {
+    "knowledge_base": "Knowledge base load",
+    "map": "Document fact extraction",
+    "retrieval": "DSM-5 retrieval",
+    "prompt": "Prompt assembly",
+    "model": "Model",
+    "time_to_first_token": "First token",
+    "transform": "End to end",
+    "transform_cached": "End to end (cached)",
+}
+
 # Initialize session state
-if 'transformed_notes' not in st.session_state:
-    st.session_state.transformed_notes = []
+if 'latest_note_id' not in st.session_state:
+    st.session_state.latest_note_id = None
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 1
 if 'dsm_knowledge_base' not in st.session_state:
     st.session_state.dsm_knowledge_base = None
 if 'dsm_loaded' not in st.session_state:
     st.session_state.dsm_loaded = False
 
-def create_dsm_knowledge_base():
-    """Create a vector knowledge base from DSM-5 manual"""
+def create_dsm_knowledge_base(build=True):
+    """Load the shared DSM-5 vector index, building and persisting it if needed"""
     try:
-        pdf_path = "APA_DSM-5-Contents.pdf"
-        if not os.path.exists(pdf_path):
-            return f"Error: DSM-5 manual file not found at {pdf_path}"
-        
-        # Load and extract text from PDF
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        
-        # Clean and preprocess text
-        text = re.sub(r'\s+', ' ', text)  # Remove extra whitespace
-        text = re.sub(r'[^\w\s\.\,\;\:\!\?\-\(\)]', '', text)  # Remove special characters
-        
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        
-        chunks = text_splitter.split_text(text)
-        
-        # Create documents
-        documents = [Document(page_content=chunk, metadata={"source": "DSM-5"}) for chunk in chunks]
-        
-        # Create embeddings and vector store
-        embeddings = OpenAIEmbeddings(openai_api_key=st.session_state["openai_api_key"])
-        vectorstore = FAISS.from_documents(
-            documents=documents,
-            embedding=embeddings
-        )
-        
-        return vectorstore, len(chunks)
-        
+        if not os.path.exists(DSM_PDF_PATH):
+            return f"Error: DSM-5 manual file not found at {DSM_PDF_PATH}"
+
+        result = get_dsm_index(st.session_state["openai_api_key"], build=build)
+        if result is None:
+            return "DSM knowledge base has not been built yet"
+        return result
+
     except Exception as e:
         return f"Error creating DSM knowledge base: {str(e)}"
 
-def query_dsm_knowledge(query, top_k=3):
-    """Query the DSM knowledge base for relevant information"""
+def query_dsm_knowledge(diagnosis, raw_note="", top_k=DSM_TOP_K, timings=None):
+    """Query the DSM knowledge base; return relevant chunk texts in rank order"""
     try:
         if st.session_state.dsm_knowledge_base is None:
             return "DSM knowledge base not loaded"
         
-        # Search for relevant content
-        results = st.session_state.dsm_knowledge_base.similarity_search(query, k=top_k)
+        # Fuse lexical matches on the note with a short diagnosis-focused vector query
+        with stage("retrieval", timings):
+            results = st.session_state.dsm_knowledge_base.search(diagnosis, raw_note, k=top_k)
         
-        # Combine relevant information
-        relevant_info = "\n\n".join([doc.page_content for doc in results])
-        return relevant_info
+        return [doc.page_content for doc in results]
         
     except Exception as e:
         return f"Error querying DSM knowledge base: {str(e)}"
@@ -167,169 +169,477 @@ def query_dsm_knowledge(query, top_k=3):
 def extract_text_from_pdf(pdf_file):
     """Extract text from uploaded PDF file"""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return "\n".join(text for _, text in iter_pdf_pages(pdf_file))
     except Exception as e:
         return f"Error extracting text from PDF: {str(e)}"
 
-def transform_note_with_gpt(raw_note, diagnosis, output_style, api_key):
-    """Transform raw note using OpenAI API"""
+def get_dsm_context(raw_note, diagnosis, timings=None):
+    """Look up DSM-5 chunks relevant to a note, or [] when unavailable"""
+    if st.session_state.dsm_loaded and st.session_state.dsm_knowledge_base:
+        result = query_dsm_knowledge(diagnosis, raw_note, timings=timings)
+        if isinstance(result, list):
+            return result
+    return []
+
+def lookup_cached_note(raw_note, diagnosis, output_style, use_cache, parallel_sections, timings, start):
+    """Retrieve DSM-5 context for a note and look it up in the response cache.
+
+    Returns (dsm_chunks, cache_key, cached_note); cached_note is None on a
+    miss or when use_cache is False. A hit is recorded in ``timings`` (if
+    given) and the rolling metrics, measured from ``start``.
+    """
+    dsm_chunks = get_dsm_context(raw_note, diagnosis, timings)
+    cache_key = response_cache_key(raw_note, diagnosis, output_style, NOTE_MODEL, NOTE_TEMPERATURE, dsm_chunks,
+                                   NOTE_PROMPT_VERSION, mode=SECTIONS_CACHE_MODE if parallel_sections else None)
+    if not use_cache:
+        return dsm_chunks, cache_key, None
+    cached_note = get_response_cache().get(cache_key)
+    record_cache("response", cached_note is not None)
+    if cached_note is not None:
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings.update(cached=True, total_time=elapsed)
+        if METRICS_ENABLED:
+            get_metrics().observe("transform_cached", elapsed)
+    return dsm_chunks, cache_key, cached_note
+
+def transform_note_with_gpt(raw_note, diagnosis, output_style, api_key, use_cache=True, timings=None,
+                            parallel_sections=False):
+    """Transform raw note using OpenAI API.
+
+    Identical inputs (including the retrieved DSM-5 context) are answered
+    from the response cache; use_cache=False forces a fresh generation and
+    replaces the cached entry. Stage timings and token usage are added to
+    ``timings`` when a dict is passed. With parallel_sections=True every
+    section of the format is generated by its own concurrent request and
+    the sections are joined in order.
+    """
     try:
-        # Set OpenAI API key
-        openai.api_key = api_key
-        
-        # Create comprehensive system prompt based on output style
-        if output_style == "SOAP":
-            system_prompt = """Purpose:
-Transform raw, unstructured clinical notes into structured, comprehensive clinical notes following a standard clinical documentation format. The completed notes should maintain all essential content from the raw notes while organizing the information under clear sections and integrating therapeutic interventions and outcomes.
-
-Instructions:
-
-Input Structure:
-You will receive a block of raw clinical notes that consist of unstructured, fragmented statements capturing the client's experiences, symptoms, emotional states, and any therapeutic interventions. The clinician may also provide a preliminary diagnosis.
-
-Output Structure:
-SOAP (Subjective, Objective, Assessment, Plan) format:
-- Subjective: Client's reported experiences and emotional states.
-- Objective: Observable behaviors, symptoms, and therapist observations.
-- Assessment: Clinical interpretations and diagnostic impressions.
-- Plan: Interventions, goals, and follow-up actions.
-
-If a diagnosis is included, use it to:
-- Identify the corresponding DSM-5 classification and ICD-10-CM code.
-- Locate and highlight supporting content from the raw note that justifies the diagnosis.
-
-Transformation Guidelines:
-- Maintain all factual content from the raw notes. Do not omit or alter any reported information.
-- Organize the content logically, ensuring a clear flow of information based on the chosen format.
-- Reframe emotional expressions into clinically appropriate language without diminishing the client's emotional experiences.
-- Include specific numeric data, such as distress levels or duration of symptoms, in the relevant sections.
-- Document therapeutic interventions explicitly, specifying the technique used and observed outcomes.
-- Link clinical symptoms explicitly to the provided diagnosis where applicable, referencing the DSM-5 and ICD-10-CM.
-
-Tone and Style:
-- Use neutral, professional, and clinical language.
-- Avoid subjective interpretations or assumptions not stated in the raw notes. Avoid generating new information not stated in the raw notes. For sections not described in the raw notes, it is fine to leave them blank.
-- Ensure clarity and coherence, making the document accessible for clinical review and continuity of care."""
-        elif output_style == "DAP":
-            system_prompt = """Purpose:
-Transform raw, unstructured clinical notes into structured, comprehensive clinical notes following a standard clinical documentation format. The completed notes should maintain all essential content from the raw notes while organizing the information under clear sections and integrating therapeutic interventions and outcomes.
-
-Instructions:
-
-Input Structure:
-You will receive a block of raw clinical notes that consist of unstructured, fragmented statements capturing the client's experiences, symptoms, emotional states, and any therapeutic interventions. The clinician may also provide a preliminary diagnosis.
-
-Output Structure:
-DAP (Data, Assessment, Plan) format:
-- Data: Information shared by the client and observed in session.
-- Assessment: Clinical impressions and interpretation.
-- Plan: Future therapeutic focus and recommendations.
-
-If a diagnosis is included, use it to:
-- Identify the corresponding DSM-5 classification and ICD-10-CM code.
-- Locate and highlight supporting content from the raw note that justifies the diagnosis.
-
-Transformation Guidelines:
-- Maintain all factual content from the raw notes. Do not omit or alter any reported information.
-- Organize the content logically, ensuring a clear flow of information based on the chosen format.
-- Reframe emotional expressions into clinically appropriate language without diminishing the client's emotional experiences.
-- Include specific numeric data, such as distress levels or duration of symptoms, in the relevant sections.
-- Document therapeutic interventions explicitly, specifying the technique used and observed outcomes.
-- Link clinical symptoms explicitly to the provided diagnosis where applicable, referencing the DSM-5 and ICD-10-CM.
-
-Tone and Style:
-- Use neutral, professional, and clinical language.
-- Avoid subjective interpretations or assumptions not stated in the raw notes. Avoid generating new information not stated in the raw notes. For sections not described in the raw notes, it is fine to leave them blank.
-- Ensure clarity and coherence, making the document accessible for clinical review and continuity of care."""
-        else:  # Standard
-            system_prompt = """Purpose:
-Transform raw, unstructured clinical notes into structured, comprehensive clinical notes following a standard clinical documentation format. The completed notes should maintain all essential content from the raw notes while organizing the information under clear sections and integrating therapeutic interventions and outcomes.
-
-Instructions:
-
-Input Structure:
-You will receive a block of raw clinical notes that consist of unstructured, fragmented statements capturing the client's experiences, symptoms, emotional states, and any therapeutic interventions. The clinician may also provide a preliminary diagnosis.
-
-Output Structure:
-Standard format:
-- Presenting Problem
-- Background/History
-- Session Content
-- Interventions and Outcomes
-- Coping Strategies
-- Recommendations and Follow-Up
-
-If a diagnosis is included, use it to:
-- Identify the corresponding DSM-5 classification and ICD-10-CM code.
-- Locate and highlight supporting content from the raw note that justifies the diagnosis.
-
-Transformation Guidelines:
-- Maintain all factual content from the raw notes. Do not omit or alter any reported information.
-- Organize the content logically, ensuring a clear flow of information based on the chosen format.
-- Reframe emotional expressions into clinically appropriate language without diminishing the client's emotional experiences.
-- Include specific numeric data, such as distress levels or duration of symptoms, in the relevant sections.
-- Document therapeutic interventions explicitly, specifying the technique used and observed outcomes.
-- Link clinical symptoms explicitly to the provided diagnosis where applicable, referencing the DSM-5 and ICD-10-CM.
-
-Tone and Style:
-- Use neutral, professional, and clinical language.
-- Avoid subjective interpretations or assumptions not stated in the raw notes. Avoid generating new information not stated in the raw notes. For sections not described in the raw notes, it is fine to leave them blank.
-- Ensure clarity and coherence, making the document accessible for clinical review and continuity of care."""
-
-        # Query DSM knowledge base for relevant information
-        dsm_context = ""
-        if st.session_state.dsm_loaded and st.session_state.dsm_knowledge_base:
-            # Create a query based on the diagnosis and symptoms
-            query = f"{diagnosis} {raw_note}"
-            relevant_dsm_info = query_dsm_knowledge(query, top_k=3)
-            
-            if relevant_dsm_info and not relevant_dsm_info.startswith("Error"):
-                dsm_context = f"""
-
-Relevant DSM-5 Information:
-{relevant_dsm_info}
-"""
-
-        user_prompt = f"""
-Raw Clinical Notes:
-{raw_note}
-
-Clinician's Diagnosis:
-{diagnosis}{dsm_context}
-
-Please transform this information into a structured {output_style} note format following the comprehensive guidelines provided. Ensure all content from the raw notes is preserved and organized appropriately. Use the relevant DSM-5 information to enhance diagnostic accuracy and provide appropriate ICD-10-CM codes."""
-
-        # Use OpenAI API to generate response (updated for v1.0.0+)
-        client = openai.OpenAI(api_key=st.session_state["openai_api_key"])
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini-2025-04-14",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.3
-        )
-        
-        return response.choices[0].message.content.strip()
+        start = time.perf_counter()
+        dsm_chunks, cache_key, cached_note = lookup_cached_note(raw_note, diagnosis, output_style, use_cache,
+                                                                parallel_sections, timings, start)
+        if cached_note is not None:
+            return cached_note
+        cache = get_response_cache()
+        if parallel_sections:
+            with stage("prompt", timings):
+                section_prompts = assemble_section_prompts(raw_note, diagnosis, output_style, dsm_chunks)
+            sections = [[] for _ in section_prompts]
+            for index, delta in stream_sections_with_gpt(section_prompts, api_key, {} if timings is None else timings, start):
+                sections[index].append(delta)
+            transformed_note = "\n\n".join("".join(parts).strip() for parts in sections)
+            cache.put(cache_key, transformed_note)
+            return transformed_note
+
+        with stage("prompt", timings):
+            prompt = assemble_note_prompt(raw_note, diagnosis, output_style, dsm_chunks)
+
+        with stage("model", timings):
+            transformed_note = complete_note(prompt, api_key, timings)
+        cache.put(cache_key, transformed_note)
+        if METRICS_ENABLED:
+            get_metrics().observe("transform", time.perf_counter() - start)
+        return transformed_note
     
     except Exception as e:
         return f"Error: {str(e)}"
 
-def save_note_to_history(raw_note, diagnosis, output_style, transformed_note):
-    """Save transformed note to session history"""
-    note_entry = {
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'raw_note': raw_note,
-        'diagnosis': diagnosis,
-        'output_style': output_style,
-        'transformed_note': transformed_note
-    }
-    st.session_state.transformed_notes.append(note_entry)
+def complete_note(prompt, api_key, timings=None):
+    """Request a note in one response, retrying once with the largest output budget if it was cut off.
+
+    Raises NoteTruncatedError when even that budget is not enough, so an
+    incomplete note is never cached or saved.
+    """
+    # Use the shared pooled client (updated for v1.0.0+)
+    client = get_openai_client(api_key)
+    while True:
+        response = call_with_retries(
+            client.chat.completions.create,
+            model=NOTE_MODEL,
+            messages=prompt.messages,
+            max_tokens=prompt.max_tokens,
+            temperature=NOTE_TEMPERATURE
+        )
+        record_usage(response.usage, timings)
+        if response.choices[0].finish_reason != TRUNCATED_FINISH_REASON:
+            return response.choices[0].message.content.strip()
+        wider = widen_output_budget(prompt)
+        if wider is None:
+            raise NoteTruncatedError(prompt.max_tokens)
+        prompt = wider
+
+def finish_stream_timings(timings, start, model_start):
+    """Record total_time for a completed stream and feed the model, first-token and end-to-end stages to the metrics"""
+    timings["total_time"] = time.perf_counter() - start
+    if METRICS_ENABLED:
+        metrics = get_metrics()
+        stages = timings.setdefault("stages", {})
+        stages["model"] = time.perf_counter() - model_start
+        metrics.observe("model", stages["model"])
+        if "time_to_first_token" in timings:
+            metrics.observe("time_to_first_token", timings["time_to_first_token"])
+        metrics.observe("transform", timings["total_time"])
+
+def stream_note_with_gpt(prompt, api_key, timings, start):
+    """Stream the transformed note from OpenAI, yielding text as it arrives.
+
+    Fills ``timings`` with time_to_first_token and total_time in seconds,
+    measured from ``start``. Errors, including NoteTruncatedError when the
+    reply stops at max_tokens, are raised to the caller, which decides what
+    to do with the partial text received so far.
+    """
+    client = get_openai_client(api_key)
+    # Retries only cover opening the stream; once tokens flow, errors go to the caller
+    model_start = time.perf_counter()
+    stream = call_with_retries(
+        client.chat.completions.create,
+        model=NOTE_MODEL,
+        messages=prompt.messages,
+        max_tokens=prompt.max_tokens,
+        temperature=NOTE_TEMPERATURE,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    finish_reason = None
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            # Sent as a final chunk with no choices
+            record_usage(chunk.usage, timings)
+        if not chunk.choices:
+            continue
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if "time_to_first_token" not in timings:
+                timings["time_to_first_token"] = time.perf_counter() - start
+            yield delta
+    if finish_reason == TRUNCATED_FINISH_REASON:
+        raise NoteTruncatedError(prompt.max_tokens)
+    finish_stream_timings(timings, start, model_start)
+
+def stream_sections_with_gpt(section_prompts, api_key, timings, start):
+    """Stream every section of a note concurrently, yielding (section index, text) as tokens arrive.
+
+    Each section is its own streamed request on a worker thread; deltas
+    come back through a queue so the caller (and Streamlit) only ever runs
+    on the script thread. A section cut off at its max_tokens is streamed
+    again on its own with the largest output budget, after yielding
+    (section index, None) to say its partial text should be discarded.
+    Fills ``timings`` like stream_note_with_gpt(), plus per-section
+    latencies in timings["sections"]. The first error from any section,
+    including NoteTruncatedError for a section cut off even at the largest
+    budget, is raised and the other sections' streams are closed.
+    """
+    client = get_openai_client(api_key)
+    events = queue.Queue()
+    cancelled = threading.Event()
+
+    def generate(index, prompt):
+        try:
+            section_start = time.perf_counter()
+            while not cancelled.is_set():
+                stream = call_with_retries(
+                    client.chat.completions.create,
+                    model=NOTE_MODEL,
+                    messages=prompt.messages,
+                    max_tokens=prompt.max_tokens,
+                    temperature=NOTE_TEMPERATURE,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                finish_reason = None
+                with stream:
+                    for chunk in stream:
+                        if cancelled.is_set():
+                            # Closing the stream stops the request, and its token spend, server-side
+                            return
+                        if getattr(chunk, "usage", None):
+                            events.put(("usage", index, chunk.usage))
+                        if chunk.choices:
+                            finish_reason = chunk.choices[0].finish_reason or finish_reason
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            events.put(("delta", index, chunk.choices[0].delta.content))
+                if finish_reason != TRUNCATED_FINISH_REASON:
+                    events.put(("done", index, time.perf_counter() - section_start))
+                    return
+                wider = widen_output_budget(prompt)
+                if wider is None:
+                    raise NoteTruncatedError(prompt.max_tokens)
+                events.put(("reset", index, None))
+                prompt = wider
+        except Exception as e:
+            events.put(("error", index, e))
+
+    model_start = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=len(section_prompts))
+    try:
+        for index, (_, prompt) in enumerate(section_prompts):
+            pool.submit(generate, index, prompt)
+        section_times = timings.setdefault("sections", {})
+        pending = len(section_prompts)
+        while pending:
+            kind, index, value = events.get()
+            if kind == "delta":
+                if "time_to_first_token" not in timings:
+                    timings["time_to_first_token"] = time.perf_counter() - start
+                yield index, value
+            elif kind == "reset":
+                yield index, None
+            elif kind == "usage":
+                record_usage(value, timings)
+            elif kind == "done":
+                section_times[section_prompts[index][0]] = value
+                pending -= 1
+            else:
+                raise value
+    finally:
+        # After an error (or the caller stopping early) nothing reads the other sections: stop them
+        cancelled.set()
+        pool.shutdown(wait=False)
+    timings["sections"] = {name: section_times[name] for name, _ in section_prompts}
+    finish_stream_timings(timings, start, model_start)
+
+def render_streamed_note(placeholder, raw_note, diagnosis, output_style, api_key, use_cache=True,
+                         parallel_sections=False):
+    """Render a streamed note into ``placeholder``; return (text, timings, error).
+
+    With parallel_sections=True each section streams into its own slot.
+    """
+    start = time.perf_counter()
+    parts = []
+    timings = {}
+    last_render = 0.0
+    try:
+        dsm_chunks, cache_key, cached_note = lookup_cached_note(raw_note, diagnosis, output_style, use_cache,
+                                                                parallel_sections, timings, start)
+        if cached_note is not None:
+            placeholder.markdown(cached_note)
+            return cached_note, timings, None
+        cache = get_response_cache()
+
+        if parallel_sections:
+            return render_streamed_sections(placeholder, raw_note, diagnosis, output_style, dsm_chunks, api_key,
+                                            cache, cache_key, timings, start)
+
+        with stage("prompt", timings):
+            prompt = assemble_note_prompt(raw_note, diagnosis, output_style, dsm_chunks)
+        while True:
+            parts = []
+            try:
+                for delta in stream_note_with_gpt(prompt, api_key, timings, start):
+                    parts.append(delta)
+                    # Throttle redraws so long notes don't flood the websocket
+                    now = time.perf_counter()
+                    if now - last_render >= STREAM_RENDER_INTERVAL:
+                        placeholder.markdown("".join(parts) + " ▌")
+                        last_render = now
+                break
+            except NoteTruncatedError:
+                # Cut off at max_tokens: stream it again, replacing the partial text, with the largest budget
+                prompt = widen_output_budget(prompt)
+                if prompt is None:
+                    raise
+    except Exception as e:
+        text = "".join(parts)
+        if text:
+            placeholder.markdown(text)
+        return text, timings, f"Error: {str(e)}"
+    text = "".join(parts).strip()
+    placeholder.markdown(text)
+    cache.put(cache_key, text)
+    return text, timings, None
+
+def render_streamed_sections(placeholder, raw_note, diagnosis, output_style, dsm_chunks, api_key,
+                             cache, cache_key, timings, start):
+    """Stream each section of a note into its own slot in ``placeholder``; return (text, timings, error)"""
+    with stage("prompt", timings):
+        section_prompts = assemble_section_prompts(raw_note, diagnosis, output_style, dsm_chunks)
+    with placeholder.container():
+        slots = [st.empty() for _ in section_prompts]
+    sections = [[] for _ in section_prompts]
+    last_render = [0.0] * len(section_prompts)
+    try:
+        for index, delta in stream_sections_with_gpt(section_prompts, api_key, timings, start):
+            if delta is None:
+                # The section was cut off and is being regenerated with a larger budget
+                sections[index] = []
+                slots[index].markdown(" ▌")
+                continue
+            sections[index].append(delta)
+            now = time.perf_counter()
+            if now - last_render[index] >= STREAM_RENDER_INTERVAL:
+                slots[index].markdown("".join(sections[index]) + " ▌")
+                last_render[index] = now
+    except Exception as e:
+        for slot, parts in zip(slots, sections):
+            slot.markdown("".join(parts))
+        return "\n\n".join("".join(parts).strip() for parts in sections if parts), timings, f"Error: {str(e)}"
+    texts = ["".join(parts).strip() for parts in sections]
+    for slot, text in zip(slots, texts):
+        slot.markdown(text)
+    text = "\n\n".join(texts)
+    cache.put(cache_key, text)
+    return text, timings, None
+
+def run_batch_upload(batch_file, concurrency):
+    """Transform an uploaded notes file, resuming from its checkpoint; return a summary or error string"""
+    try:
+        content = batch_file.getvalue()
+        rows = load_rows(io.BytesIO(content), batch_file.name)
+        # Same upload -> same output file, so a re-run picks up where it stopped
+        os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(BATCH_OUTPUT_DIR, f"{hashlib.sha256(content).hexdigest()[:16]}.jsonl")
+
+        progress = st.progress(0.0, text="Starting batch...")
+
+        def report(done, total, record):
+            progress.progress(done / total if total else 1.0, text=f"{done}/{total} notes transformed")
+
+        retriever = st.session_state.dsm_knowledge_base if st.session_state.dsm_loaded else None
+        summary = asyncio.run(run_batch(
+            rows, output_path, st.session_state["openai_api_key"], retriever,
+            concurrency=concurrency, on_progress=report
+        ))
+        summary["output_path"] = output_path
+        return summary
+
+    except Exception as e:
+        return f"Error running batch: {str(e)}"
+
+def extract_document_facts(document, raw_note, api_key, use_cache=True, timings=None):
+    """Condense an uploaded transcript or PDF to per-segment facts (the map step).
+
+    Returns the combined facts, with any typed notes first, as the raw note
+    for the final transformation, or an error string.
+    """
+    try:
+        progress = st.progress(0.0, text=f"Reading {document.name}...")
+
+        def report(done, total):
+            progress.progress(done / total, text=f"Extracting facts: {done}/{total} segments")
+
+        with stage("map", timings):
+            segments = split_segments(iter_document_lines(document, document.name))
+            facts, stats = map_segments(segments, api_key, use_cache=use_cache, on_progress=report)
+        progress.empty()
+        if timings is not None:
+            timings["document"] = dict(stats, name=document.name)
+        if not facts:
+            return f"Error: No text could be extracted from {document.name}"
+        return combine_facts(facts, raw_note)
+
+    except Exception as e:
+        return f"Error: Could not process {document.name}: {str(e)}"
+
+def merge_document_timings(timings, document_timings):
+    """Fold the map step's timings into those of the final transformation"""
+    if not document_timings:
+        return
+    map_seconds = document_timings.get("stages", {}).get("map", 0.0)
+    timings["stages"] = dict(document_timings.get("stages", {}), **timings.get("stages", {}))
+    timings["document"] = document_timings["document"]
+    for key in ("time_to_first_token", "total_time"):
+        if key in timings:
+            timings[key] += map_seconds
+
+@st.fragment(run_every=KB_PROGRESS_INTERVAL)
+def render_kb_build_progress():
+    """Poll the background build; rerun the whole app once it has finished"""
+    state = get_kb_builder().progress()
+    if state["status"] != "running":
+        st.rerun()
+    st.info("⏳ Preparing the DSM-5 knowledge base in the background. Notes are transformed without DSM-5 context until it is ready.")
+    fraction = min(1.0, state["done"] / state["total"]) if state["total"] else 0.0
+    st.progress(fraction, text=describe_progress(state))
+
+def render_performance_panel(timings):
+    """Per-note breakdown of stage latencies and token usage"""
+    with st.expander("⏱️ Performance"):
+        stages = timings.get("stages", {})
+        rows = [{"Stage": STAGE_LABELS.get(name, name), "ms": round(seconds * 1000, 1)}
+                for name, seconds in stages.items()]
+        for name, seconds in timings.get("sections", {}).items():
+            rows.append({"Stage": f"Section: {name}", "ms": round(seconds * 1000, 1)})
+        if "time_to_first_token" in timings:
+            rows.append({"Stage": "First token", "ms": round(timings["time_to_first_token"] * 1000, 1)})
+        if "total_time" in timings:
+            rows.append({"Stage": "Total", "ms": round(timings["total_time"] * 1000, 1)})
+        st.table(rows)
+        usage = timings.get("usage")
+        if usage:
+            st.caption(f"Tokens: {usage['prompt_tokens']} prompt ({usage['cached_tokens']} cached) · "
+                       f"{usage['completion_tokens']} completion")
+        document = timings.get("document")
+        if document:
+            st.caption(f"{document['name']}: {document['segments']} segments ({document['cached']} cached) · "
+                       f"fact extraction used {document['prompt_tokens']} prompt / "
+                       f"{document['completion_tokens']} completion tokens")
+
+def render_metrics_summary():
+    """Rolling p50/p95 per stage, token throughput and cache hit rates for this server"""
+    snapshot = get_metrics().snapshot()
+    if not snapshot["stages"]:
+        return
+    with st.expander("📈 Performance (rolling)"):
+        st.table([
+            {"Stage": STAGE_LABELS.get(name, name), "n": stats["count"],
+             "p50 ms": round(stats["p50"] * 1000, 1), "p95 ms": round(stats["p95"] * 1000, 1)}
+            for name, stats in sorted(snapshot["stages"].items())
+        ])
+        st.caption(f"Tokens per minute: {snapshot['tokens_per_minute']:.0f}")
+        for cache, rate in snapshot["hit_rates"].items():
+            if rate is not None:
+                st.caption(f"{cache.capitalize()} cache hit rate: {rate:.0%}")
+
+def history_owner():
+    """The signed-in user's history owner if the app has login configured, else None"""
+    user = getattr(st, "user", None)
+    try:
+        if user is not None and user.get("is_logged_in") and user.get("email"):
+            return f"user:{user.get('email')}"
+    except Exception:
+        # st.user raises when authentication is not configured
+        pass
+    return None
+
+def get_history():
+    """Return (history store, owner) for this visitor.
+
+    Signed-in users get the shared on-disk history. Without login nobody
+    could find their notes again once the session ends, so they are kept
+    in an in-memory store that lives and dies with the browser session.
+    """
+    owner = history_owner()
+    if owner:
+        return get_note_history(), owner
+    if 'session_history' not in st.session_state:
+        st.session_state.session_history = NoteHistory(SESSION_HISTORY_PATH)
+    return st.session_state.session_history, "session"
+
+def save_note_to_history(raw_note, diagnosis, output_style, transformed_note, timings=None):
+    """Save transformed note to this visitor's history"""
+    history, owner = get_history()
+    note_id = history.add(
+        owner,
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        raw_note, diagnosis, output_style, transformed_note, timings
+    )
+    st.session_state.latest_note_id = note_id
+
+def delete_history_note(note_id):
+    """Button callback: remove one of this visitor's notes from the history"""
+    history, owner = get_history()
+    history.delete(owner, note_id)
+    if st.session_state.latest_note_id == note_id:
+        st.session_state.latest_note_id = None
+
+def change_history_page(delta):
+    """Button callback: move the history sidebar by ``delta`` pages"""
+    st.session_state.history_page = max(1, st.session_state.history_page + delta)
+
+def reset_history_page():
+    """Filter callback: go back to the first page when the search changes"""
+    st.session_state.history_page = 1
 
 def main():
     # Header
@@ -350,39 +660,87 @@ def main():
             st.warning("Please enter your OpenAI API key to use the app.")
         st.markdown("---")
         st.markdown("### 📚 DSM-5 Knowledge Base")
-        
+
+        builder = get_kb_builder()
+        if not st.session_state.dsm_loaded and st.session_state.get("openai_api_key"):
+            # Warm up once per server: load the saved index, or build it, off the UI thread
+            if KB_AUTOBUILD and builder.progress()["status"] == "idle" and os.path.exists(DSM_PDF_PATH):
+                builder.start(st.session_state["openai_api_key"])
+            # Pick up an index persisted by an earlier build without re-embedding
+            if not builder.running:
+                result = create_dsm_knowledge_base(build=False)
+                if isinstance(result, tuple):
+                    st.session_state.dsm_knowledge_base = result[0]
+                    st.session_state.dsm_loaded = True
+
         if st.session_state.dsm_loaded:
             st.success("✅ DSM-5 Knowledge Base loaded")
-            st.info("Vector embeddings created for semantic search")
+            st.info("Hybrid BM25 + vector search over the shared on-disk index")
+            st.caption(f"Embeddings: {EMBEDDING_BACKEND} · Index: {INDEX_TYPE}")
+        elif builder.running:
+            render_kb_build_progress()
         else:
             st.warning("⚠️ DSM-5 Knowledge Base not initialized")
+            build_state = builder.progress()
+            if build_state["status"] == "failed":
+                st.error(f"Error creating DSM knowledge base: {build_state['error']}")
             if st.button("🔧 Initialize Knowledge Base"):
-                with st.spinner("Creating DSM-5 knowledge base..."):
-                    result = create_dsm_knowledge_base()
-                    if isinstance(result, tuple):
-                        vectorstore, chunk_count = result
-                        st.session_state.dsm_knowledge_base = vectorstore
-                        st.session_state.dsm_loaded = True
-                        st.success(f"✅ Knowledge base created with {chunk_count} chunks")
-                        st.rerun()
-                    else:
-                        st.error(result)
+                if not os.path.exists(DSM_PDF_PATH):
+                    st.error(f"Error: DSM-5 manual file not found at {DSM_PDF_PATH}")
+                else:
+                    builder.start(st.session_state["openai_api_key"])
+                    st.rerun()
         
+        cache_stats = get_response_cache().stats
+        st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        if METRICS_ENABLED:
+            render_metrics_summary()
+
         st.markdown("---")
         st.markdown("### 📋 Note History")
-        if st.session_state.transformed_notes:
-            for i, note in enumerate(reversed(st.session_state.transformed_notes)):
-                with st.expander(f"Note {len(st.session_state.transformed_notes) - i} - {note['timestamp']}"):
+        history, owner = get_history()
+        if not history_owner():
+            st.caption("Notes are kept for this browser session only")
+        history_search = st.text_input("Search notes", key="history_search", placeholder="Search raw and transformed text...",
+                                       on_change=reset_history_page)
+        history_style = st.selectbox("Filter by style", ["All"] + OUTPUT_STYLES, key="history_style",
+                                     on_change=reset_history_page)
+        style_filter = None if history_style == "All" else history_style
+
+        # Only one page of summaries is queried per rerun; note bodies load on demand
+        total_notes = history.count(owner, history_search, style_filter)
+        if total_notes:
+            page_count = (total_notes + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            page = min(st.session_state.history_page, page_count)
+            for note in history.page(owner, (page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE, history_search, style_filter):
+                with st.expander(f"Note {note['id']} - {note['timestamp']}"):
                     st.write(f"**Style:** {note['output_style']}")
-                    st.write(f"**Diagnosis:** {note['diagnosis'][:100]}...")
-                    if st.button(f"View Full Note {len(st.session_state.transformed_notes) - i}", key=f"view_{i}"):
-                        st.text_area("Transformed Note", note['transformed_note'], height=300, key=f"history_{i}", disabled=True)
+                    st.write(f"**Diagnosis:** {note['diagnosis']}...")
+                    if st.button(f"View Full Note {note['id']}", key=f"view_{note['id']}"):
+                        st.session_state.history_selected = note['id']
+                    st.button(f"Delete Note {note['id']}", key=f"delete_{note['id']}",
+                              on_click=delete_history_note, args=(note['id'],))
+                    if st.session_state.get("history_selected") == note['id']:
+                        full_note = history.get(owner, note['id'])
+                        st.text_area("Transformed Note", full_note['transformed_note'], height=300, key=f"history_{note['id']}", disabled=True)
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            prev_col.button("◀", key="history_prev", disabled=page <= 1, on_click=change_history_page, args=(-1,))
+            page_col.caption(f"Page {page} of {page_count} · {total_notes} notes")
+            next_col.button("▶", key="history_next", disabled=page >= page_count, on_click=change_history_page, args=(1,))
+        elif history_search or style_filter:
+            st.info("No notes match your search")
         else:
             st.info("No notes transformed yet")
     
     # Main content area
     col1, col2 = st.columns([1, 1])
-    
+
+    # The output header and a slot for streamed text go first so tokens
+    # render in the output pane while the form handler is still running
+    with col2:
+        st.markdown('<h2 class="section-header">📋 Output</h2>', unsafe_allow_html=True)
+        stream_placeholder = st.empty()
+
     with col1:
         st.markdown('<h2 class="section-header">📝 Input</h2>', unsafe_allow_html=True)
         
@@ -402,7 +760,7 @@ def main():
             )
             output_style = st.selectbox(
                 "Output Style",
-                ["SOAP", "DAP", "Standard"],
+                OUTPUT_STYLES,
                 help="SOAP: Subjective, Objective, Assessment, Plan | DAP: Data, Assessment, Plan | Standard: Comprehensive clinical format"
             )
             if output_style == "SOAP":
@@ -411,30 +769,83 @@ def main():
                 st.info("**DAP Format:** Data, Assessment, Plan")
             else:
                 st.info("**Standard Format:** Presenting Problem, Background/History, Session Content, Interventions and Outcomes, Coping Strategies, Recommendations and Follow-Up")
+            uploaded_document = st.file_uploader(
+                "Session transcript or intake document (optional)",
+                type=DOCUMENT_TYPES,
+                help="Long documents are split into segments whose facts are extracted in parallel, then combined into one note with any notes typed above"
+            )
+            stream_output = st.checkbox("Stream output as it is generated", value=True)
+            parallel_sections = st.checkbox(
+                "Generate sections in parallel", value=PARALLEL_SECTIONS,
+                help="One request per section of the note, run concurrently; usually faster for long notes, at the cost of repeating the prompt for each section"
+            )
+            regenerate = st.checkbox("Regenerate (ignore cached result)", value=False)
             submitted = st.form_submit_button("🔄 Transform Note", type="primary", disabled=("openai_api_key" not in st.session_state or not st.session_state["openai_api_key"]))
             if submitted:
-                if not raw_note or not diagnosis:
-                    st.error("Please fill in both the raw notes and diagnosis fields.")
+                document_timings = {}
+                note_input = None
+                if (not raw_note and uploaded_document is None) or not diagnosis:
+                    st.error("Please fill in the diagnosis and either the raw notes or an uploaded document.")
+                elif uploaded_document is not None:
+                    # Map step; the combined facts then go through the usual single-note path
+                    note_input = extract_document_facts(
+                        uploaded_document, raw_note, st.session_state["openai_api_key"],
+                        use_cache=not regenerate, timings=document_timings
+                    )
+                    if note_input.startswith("Error:"):
+                        st.error(note_input)
+                        note_input = None
                 else:
+                    note_input = raw_note
+                if note_input is not None and stream_output:
+                    transformed_note, timings, error = render_streamed_note(
+                        stream_placeholder, note_input, diagnosis, output_style, st.session_state["openai_api_key"],
+                        use_cache=not regenerate, parallel_sections=parallel_sections
+                    )
+                    if error:
+                        st.error(error)
+                        if transformed_note:
+                            st.warning("The partial output shown was not saved to history.")
+                    else:
+                        stream_placeholder.empty()
+                        merge_document_timings(timings, document_timings)
+                        save_note_to_history(note_input, diagnosis, output_style, transformed_note, timings)
+                        st.success("Note transformed successfully!")
+                elif note_input is not None:
                     with st.spinner("Transforming note with AI..."):
+                        start = time.perf_counter()
+                        timings = {}
                         transformed_note = transform_note_with_gpt(
-                            raw_note, diagnosis, output_style, st.session_state["openai_api_key"]
+                            note_input, diagnosis, output_style, st.session_state["openai_api_key"],
+                            use_cache=not regenerate, timings=timings, parallel_sections=parallel_sections
                         )
                         if transformed_note.startswith("Error:"):
                             st.error(transformed_note)
                         else:
-                            save_note_to_history(raw_note, diagnosis, output_style, transformed_note)
+                            timings["total_time"] = time.perf_counter() - start
+                            merge_document_timings(timings, document_timings)
+                            save_note_to_history(note_input, diagnosis, output_style, transformed_note, timings)
                             st.success("Note transformed successfully!")
     
     with col2:
-        st.markdown('<h2 class="section-header">📋 Output</h2>', unsafe_allow_html=True)
-        
         # Display transformed note
-        if st.session_state.transformed_notes:
-            latest_note = st.session_state.transformed_notes[-1]
+        latest_note = None
+        if st.session_state.latest_note_id is not None:
+            history, owner = get_history()
+            latest_note = history.get(owner, st.session_state.latest_note_id)
+        if latest_note:
             st.markdown('<div class="output-box">', unsafe_allow_html=True)
             st.markdown(f"**{latest_note['output_style']} Note**")
             st.markdown(f"*Generated on: {latest_note['timestamp']}*")
+            timings = latest_note.get('timings', {})
+            if timings.get("cached"):
+                st.caption("Served from the response cache")
+            elif "time_to_first_token" in timings:
+                st.caption(f"First token in {timings['time_to_first_token']:.2f} s · completed in {timings['total_time']:.1f} s")
+            elif "total_time" in timings:
+                st.caption(f"Completed in {timings['total_time']:.1f} s")
+            if timings.get("stages") or timings.get("usage"):
+                render_performance_panel(timings)
             st.text_area(
                 "Transformed Note",
                 latest_note['transformed_note'],
@@ -466,6 +877,29 @@ Original Diagnosis: {latest_note['diagnosis']}
             st.info("Transform a note to see the output here")
             st.markdown('</div>', unsafe_allow_html=True)
     
+    # Batch mode
+    st.markdown("---")
+    with st.expander("📦 Batch Transform"):
+        st.markdown("Upload a JSONL or CSV file with `raw_note`, `diagnosis` and `output_style` columns. Re-uploading the same file resumes an interrupted run.")
+        batch_file = st.file_uploader("Notes file", type=["jsonl", "csv"], key="batch_file")
+        batch_concurrency = st.slider("Concurrent requests", 1, 32, BATCH_CONCURRENCY)
+        if st.button("▶️ Run Batch", disabled=batch_file is None or not st.session_state.get("openai_api_key")):
+            result = run_batch_upload(batch_file, batch_concurrency)
+            if isinstance(result, dict):
+                st.session_state.batch_result = result
+            else:
+                st.error(result)
+        batch_result = st.session_state.get("batch_result")
+        if batch_result:
+            st.success(f"✅ {batch_result['ok']} transformed, {batch_result['error']} failed, {batch_result['skipped']} already done")
+            with open(batch_result["output_path"], 'rb') as file:
+                st.download_button(
+                    label="📥 Download Results (JSONL)",
+                    data=file.read(),
+                    file_name=f"transformed_notes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                    mime="application/jsonl"
+                )
+
     # Footer
     st.markdown("---")
     st.markdown("""
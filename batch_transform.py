@@ -0,0 +1,245 @@
+"""Bulk note transformation: JSONL/CSV in, JSONL out, with bounded async concurrency.
+
+Usage:
+    python batch_transform.py notes.jsonl transformed.jsonl --concurrency 8 --tpm 200000
+
+Each input row needs raw_note and diagnosis; output_style defaults to SOAP
+and id defaults to the row number. Results are appended to the output
+file as they finish, so re-running the same command resumes from the
+last checkpoint and only retries rows that are missing or failed.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from dsm_index import DSM_TOP_K
+from note_transform import (NOTE_MODEL, NOTE_PROMPT_VERSION, NOTE_TEMPERATURE, OUTPUT_STYLES, TRUNCATED_FINISH_REASON,
+                            NoteTruncatedError, assemble_note_prompt, widen_output_budget)
+from openai_client import call_with_retries_async, make_async_openai_client
+from response_cache import get_response_cache, response_cache_key
+
+BATCH_CONCURRENCY = 8
+BATCH_TOKENS_PER_MINUTE = 200000
+
+
+def load_rows(source, name=None):
+    """Read note rows from a JSONL or CSV path or file-like object"""
+    name = name or (source if isinstance(source, str) else getattr(source, "name", ""))
+    # utf-8-sig drops the byte-order mark Excel puts before the CSV header
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8-sig') as file:
+            content = file.read()
+    else:
+        content = source.read()
+        if isinstance(content, bytes):
+            content = content.decode("utf-8-sig")
+        elif content.startswith("\ufeff"):
+            content = content[1:]
+
+    if name.lower().endswith(".csv"):
+        records = list(csv.DictReader(io.StringIO(content)))
+    else:
+        records = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    rows = []
+    for i, record in enumerate(records):
+        output_style = (record.get("output_style") or "SOAP").strip()
+        if output_style not in OUTPUT_STYLES:
+            raise ValueError(f"Row {i + 1}: unknown output_style {output_style!r}")
+        for field in ("raw_note", "diagnosis"):
+            if not str(record.get(field) or "").strip():
+                raise ValueError(f"Row {i + 1}: missing {field}")
+        rows.append({
+            "id": str(record.get("id") or i + 1),
+            "raw_note": str(record["raw_note"]),
+            "diagnosis": str(record["diagnosis"]),
+            "output_style": output_style,
+        })
+    return rows
+
+
+def completed_ids(output_path):
+    """Return ids already transformed successfully in an output file"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _terminate_partial_line(output_path):
+    """Make sure appended records don't run into a line cut off by a crash"""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, 'rb+') as file:
+        file.seek(-1, os.SEEK_END)
+        if file.read(1) != b"\n":
+            file.write(b"\n")
+
+
+class TokenRateLimiter:
+    """Token bucket enforcing a tokens-per-minute budget across concurrent tasks"""
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+def lookup_dsm_context(rows, retriever, top_k=DSM_TOP_K):
+    """Retrieve DSM-5 chunk texts for every row with a single vectorized search"""
+    if retriever is None:
+        return [[] for _ in rows]
+    results = retriever.batch_search([(row["diagnosis"], row["raw_note"]) for row in rows], k=top_k)
+    return [[doc.page_content for doc in docs] for docs in results]
+
+
+async def _transform_row(client, row, dsm_chunks, semaphore, limiter, use_cache):
+    cache = get_response_cache()
+    cache_key = response_cache_key(row["raw_note"], row["diagnosis"], row["output_style"],
+                                   NOTE_MODEL, NOTE_TEMPERATURE, dsm_chunks, NOTE_PROMPT_VERSION)
+    if use_cache:
+        cached_note = cache.get(cache_key)
+        if cached_note is not None:
+            return dict(row, status="ok", transformed_note=cached_note, cached=True)
+
+    prompt = assemble_note_prompt(row["raw_note"], row["diagnosis"], row["output_style"], dsm_chunks)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            while True:
+                await limiter.acquire(prompt.token_counts["input"] + prompt.max_tokens)
+                response = await call_with_retries_async(
+                    client.chat.completions.create,
+                    model=NOTE_MODEL,
+                    messages=prompt.messages,
+                    max_tokens=prompt.max_tokens,
+                    temperature=NOTE_TEMPERATURE
+                )
+                if response.choices[0].finish_reason != TRUNCATED_FINISH_REASON:
+                    break
+                # Cut off at max_tokens: retry once with the largest budget rather than record half a note
+                wider = widen_output_budget(prompt)
+                if wider is None:
+                    raise NoteTruncatedError(prompt.max_tokens)
+                prompt = wider
+        except Exception as e:
+            return dict(row, status="error", error=str(e))
+    usage = response.usage.model_dump() if response.usage else None
+    transformed_note = response.choices[0].message.content.strip()
+    cache.put(cache_key, transformed_note)
+    return dict(row, status="ok", transformed_note=transformed_note,
+                usage=usage, latency=round(time.perf_counter() - start, 3))
+
+
+async def run_batch(rows, output_path, api_key, retriever=None, concurrency=BATCH_CONCURRENCY,
+                    tokens_per_minute=BATCH_TOKENS_PER_MINUTE, on_progress=None, use_cache=True):
+    """Transform rows concurrently, appending each result to output_path as it finishes.
+
+    Rows already recorded as ok in output_path are skipped, and rows whose
+    inputs match a cached response are answered without an API call unless
+    use_cache is False. ``on_progress``
+    is called as on_progress(done, total, record) after every row.
+    Returns a summary dict with ok/error/skipped counts.
+    """
+    done_ids = completed_ids(output_path)
+    pending = [row for row in rows if row["id"] not in done_ids]
+    summary = {"total": len(rows), "skipped": len(rows) - len(pending), "ok": 0, "error": 0}
+    if on_progress:
+        on_progress(summary["skipped"], len(rows), None)
+    if not pending:
+        return summary
+
+    _terminate_partial_line(output_path)
+    contexts = lookup_dsm_context(pending, retriever)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = TokenRateLimiter(tokens_per_minute)
+    client = make_async_openai_client(api_key)
+    try:
+        tasks = [
+            asyncio.create_task(_transform_row(client, row, dsm_chunks, semaphore, limiter, use_cache))
+            for row, dsm_chunks in zip(pending, contexts)
+        ]
+        with open(output_path, 'a', encoding='utf-8') as output:
+            for finished in asyncio.as_completed(tasks):
+                record = await finished
+                # Flushing every line makes the output file the checkpoint
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                summary[record["status"]] += 1
+                if on_progress:
+                    done = summary["skipped"] + summary["ok"] + summary["error"]
+                    on_progress(done, len(rows), record)
+    finally:
+        await client.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transform a file of raw clinical notes in bulk.")
+    parser.add_argument("input", help="JSONL or CSV file with raw_note, diagnosis and output_style columns")
+    parser.add_argument("output", help="JSONL file to append results to (also the resume checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="maximum requests in flight")
+    parser.add_argument("--tpm", type=int, default=BATCH_TOKENS_PER_MINUTE, help="token-per-minute budget")
+    parser.add_argument("--no-dsm", action="store_true", help="skip DSM-5 retrieval")
+    parser.add_argument("--regenerate", action="store_true", help="ignore cached responses")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("OPENAI_API_KEY is not set")
+
+    retriever = None
+    if not args.no_dsm:
+        from dsm_index import DSM_PDF_PATH, get_dsm_index
+
+        result = get_dsm_index(api_key, build=False) if os.path.exists(DSM_PDF_PATH) else None
+        if result is None:
+            print("DSM knowledge base has not been built yet; continuing without DSM context", file=sys.stderr)
+        else:
+            retriever = result[0]
+
+    rows = load_rows(args.input)
+
+    def report(done, total, record):
+        if record is not None and record["status"] == "error":
+            print(f"\nRow {record['id']} failed: {record['error']}", file=sys.stderr)
+        print(f"\r{done}/{total} notes transformed", end="", file=sys.stderr, flush=True)
+
+    summary = asyncio.run(run_batch(rows, args.output, api_key, retriever,
+                                    args.concurrency, args.tpm, on_progress=report,
+                                    use_cache=not args.regenerate))
+    print(f"\nDone: {summary['ok']} ok, {summary['error']} failed, {summary['skipped']} already done",
+          file=sys.stderr)
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Compare two benchmark result files metric by metric.
+
+    python -m bench.compare baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Metrics where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ("per_second",)
+IGNORED = ("count", "pages", "chunks", "chars", "pdf_bytes")
+
+
+def flatten(value, prefix=""):
+    """{"a/b/c": number} for every numeric leaf"""
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}/{key}" if prefix else key))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def compare(baseline, candidate, threshold):
+    """Yield (metric, old, new, percent change, regressed) for metrics in both runs"""
+    old = flatten(baseline["scenarios"])
+    new = flatten(candidate["scenarios"])
+    for metric in sorted(old.keys() & new.keys()):
+        if metric.rsplit("/", 1)[-1] in IGNORED:
+            continue
+        change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+        worse = -change if any(marker in metric for marker in HIGHER_IS_BETTER) else change
+        yield metric, old[metric], new[metric], change, worse > threshold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Percent change counted as a regression")
+    args = parser.parse_args(argv)
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.candidate, "r", encoding="utf-8") as file:
+        candidate = json.load(file)
+
+    print(f"baseline  {baseline['meta'].get('commit')}\ncandidate {candidate['meta'].get('commit')}\n")
+    regressions = 0
+    for metric, old, new, change, regressed in compare(baseline, candidate, args.threshold):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{metric:70} {old:12.3f} {new:12.3f} {change:+8.1f}%{flag}")
+    print(f"\n{regressions} regression(s) above {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
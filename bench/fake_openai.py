@@ -0,0 +1,179 @@
+"""Deterministic OpenAI-compatible server for offline benchmarks.
+
+Serves /v1/embeddings and /v1/chat/completions (plain and streamed).
+Embeddings are hashed bags of words, L2-normalized, so texts sharing
+vocabulary land near each other and retrieval behaves sensibly without
+a model. Completions are a canned note in the requested format.
+
+    python -m bench.fake_openai --port 8765 --completion-latency 0.2
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSIONS = 256
+STREAM_CHUNK_WORDS = 4
+
+_WORD_RE = re.compile(r"\w+")
+_SECTION_RE = re.compile(r"^- ([^:\n]+)", re.MULTILINE)
+# Per-section requests end with an instruction naming their section
+_ONLY_SECTION_RE = re.compile(r"Write only the (.+?) section")
+
+
+def fake_embedding(text, dimensions=EMBEDDING_DIMENSIONS):
+    """Hashed bag-of-words vector for text, identical on every run"""
+    vector = [0.0] * dimensions
+    for word in _WORD_RE.findall(str(text).lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def canned_note(messages):
+    """A short note with one paragraph per section listed in the system prompt, or just the one asked for"""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    only = _ONLY_SECTION_RE.search(messages[-1].get("content", "")) if messages else None
+    sections = [only.group(1)] if only else _SECTION_RE.findall(system.split("Output Structure:")[-1]) or ["Note"]
+    body = ("Client reported symptoms consistent with the clinician's diagnosis. "
+            "Session content and interventions are documented as stated in the raw notes.")
+    return "\n\n".join(f"{section.strip()}:\n{body}" for section in sections)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by make_server()
+    embedding_latency = 0.0
+    completion_latency = 0.0
+    token_latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(request)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(request)
+        self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def _embeddings(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.embedding_latency)
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                for i, text in enumerate(inputs)]
+        tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        self._send_json({"object": "list", "data": data, "model": request.get("model"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _chat(self, request):
+        messages = request.get("messages", [])
+        text = canned_note(messages)
+        finish_reason = "stop"
+        if request.get("max_tokens") and estimate_tokens(text) > request["max_tokens"]:
+            # Cut off like the real API so callers' truncation handling can be exercised
+            text, finish_reason = text[:request["max_tokens"] * 4], "length"
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(m.get("content", "")) for m in messages),
+            "completion_tokens": estimate_tokens(text),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(self.completion_latency)
+        words = text.split(" ")
+
+        if not request.get("stream"):
+            # Same generation time as the streamed reply, delivered at once
+            time.sleep(self.token_latency * math.ceil(len(words) / STREAM_CHUNK_WORDS))
+            return self._send_json({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(choices, **extra):
+            chunk = dict({"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                          "created": int(time.time()), "model": request.get("model"),
+                          "choices": choices}, **extra)
+            self._write_chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+
+        for start in range(0, len(words), STREAM_CHUNK_WORDS):
+            piece = " ".join(words[start:start + STREAM_CHUNK_WORDS])
+            if start + STREAM_CHUNK_WORDS < len(words):
+                piece += " "
+            event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            time.sleep(self.token_latency)
+        event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event([], usage=usage)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(host="127.0.0.1", port=0, embedding_latency=0.0, completion_latency=0.0, token_latency=0.0):
+    """Create (but do not start) a fake server; port 0 picks a free port"""
+    handler = type("ConfiguredHandler", (FakeOpenAIHandler,), {
+        "embedding_latency": embedding_latency,
+        "completion_latency": completion_latency,
+        "token_latency": token_latency,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a fake server on a background thread; return (server, base_url)"""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds added per embedding request")
+    parser.add_argument("--completion-latency", type=float, default=0.0,
+                        help="Seconds before a completion (or its first token) is sent")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Seconds per streamed chunk (non-streamed replies wait for the same total)")
+    args = parser.parse_args(argv)
+    server = make_server(args.host, args.port, args.embedding_latency, args.completion_latency, args.token_latency)
+    print(f"Fake OpenAI server on http://{args.host}:{server.server_address[1]}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Offline benchmark of the knowledge-base and transform pipeline.
+
+Starts the fake OpenAI server, then benchmarks each PDF (the DSM-5 file
+and synthetic PDFs of growing size) in its own process with empty index,
+response-cache and history directories. Results are written as JSON;
+compare two runs with ``python -m bench.compare old.json new.json``.
+
+    python -m bench.run --pages 200,800 --note-words 150,1500,6000 -o bench-results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench.fake_openai import start_in_thread
+from bench.synthetic import write_synthetic_pdf
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DSM_PDF = os.path.join(REPO_ROOT, "APA_DSM-5-Contents.pdf")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pdf(label, pdf_path, base_url, work_dir, args):
+    """Benchmark one PDF in a child process and return its result dict"""
+    scenario_dir = os.path.join(work_dir, label)
+    os.makedirs(scenario_dir)
+    output = os.path.join(scenario_dir, "result.json")
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=base_url,
+        DSM_INDEX_DIR=os.path.join(scenario_dir, "index"),
+        RESPONSE_CACHE_PATH=os.path.join(scenario_dir, "responses.sqlite"),
+        NOTE_HISTORY_PATH=os.path.join(scenario_dir, "history.sqlite"),
+        DSM_EMBEDDING_BACKEND="openai",
+        DSM_RETRIEVAL_MODE="hybrid",
+    )
+    command = [
+        sys.executable, "-m", "bench.scenario", pdf_path, output,
+        "--top-k", args.top_k, "--queries", str(args.queries), "--note-words", args.note_words,
+        "--transform-runs", str(args.transform_runs), "--concurrency", args.concurrency,
+        "--index-type", args.index_type,
+    ]
+    start = time.perf_counter()
+    # app.py logs a bare-mode warning per Streamlit call, so stderr is only shown on failure
+    process = subprocess.run(command, cwd=REPO_ROOT, env=env, stderr=subprocess.PIPE, text=True)
+    if process.returncode:
+        sys.stderr.write(process.stderr)
+        raise RuntimeError(f"Benchmark of {label} failed with exit code {process.returncode}")
+    with open(output, "r", encoding="utf-8") as file:
+        result = json.load(file)
+    result["label"] = label
+    result["wall_seconds"] = time.perf_counter() - start
+    return result
+
+
+def summarize_section_modes(label, transform):
+    """One line per note length comparing single-shot and per-section generation"""
+    lines = []
+    for length, entry in transform.items():
+        modes = entry.get("section_modes") if isinstance(entry, dict) else None
+        if not modes:
+            continue
+        single, parallel = modes["single"], modes["parallel_sections"]
+        lines.append(f"{label} {length} SOAP: single p50 {single['p50_ms']:.0f}ms, "
+                     f"{single['prompt_tokens_per_note']:.0f}+{single['completion_tokens_per_note']:.0f} tokens | "
+                     f"per-section p50 {parallel['p50_ms']:.0f}ms, "
+                     f"{parallel['prompt_tokens_per_note']:.0f}+{parallel['completion_tokens_per_note']:.0f} tokens")
+    return "\n".join(lines)
+
+
+def summarize(result):
+    stages = result["stages"]
+    query = stages["query"].get("top_k=3") or next(iter(stages["query"].values()))
+    return (f"{result['label']}: {stages['extraction']['pages']} pages, {stages['chunking']['chunks']} chunks | "
+            f"extract {stages['extraction']['seconds']:.2f}s, chunk {stages['chunking']['seconds']:.2f}s, "
+            f"build {stages['index_build']['seconds']:.2f}s, load {stages['index_load']['seconds']:.2f}s | "
+            f"query p50 {query['p50_ms']:.1f}ms p95 {query['p95_ms']:.1f}ms | "
+            f"peak RSS {result['peak_rss_mb']['self']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a local fake OpenAI server")
+    parser.add_argument("-o", "--output", default="bench-results.json")
+    parser.add_argument("--pages", default="200,800",
+                        help="Comma-separated synthetic PDF sizes in pages")
+    parser.add_argument("--no-dsm", action="store_true", help="Skip the bundled DSM-5 PDF")
+    parser.add_argument("--top-k", default="1,3,5,10")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per top_k value")
+    parser.add_argument("--note-words", default="150,1500,6000", help="Synthetic note lengths to transform")
+    parser.add_argument("--transform-runs", type=int, default=16, help="Notes transformed per length and load")
+    parser.add_argument("--concurrency", default="1,8", help="Concurrent transforms to test")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    parser.add_argument("--completion-latency", type=float, default=0.0,
+                        help="Simulated model latency per completion, in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Simulated generation time per few output tokens, so latency grows with note length")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_in_thread(embedding_latency=args.embedding_latency,
+                                       completion_latency=args.completion_latency,
+                                       token_latency=args.token_latency)
+    work_dir = tempfile.mkdtemp(prefix="mental-note-bench-")
+    pdfs = []
+    if not args.no_dsm and os.path.exists(DSM_PDF):
+        pdfs.append(("dsm", DSM_PDF))
+    for pages in (int(value) for value in args.pages.split(",") if value.strip()):
+        path = os.path.join(work_dir, f"synthetic-{pages}p.pdf")
+        write_synthetic_pdf(path, pages)
+        pdfs.append((f"synthetic-{pages}p", path))
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+    }
+    try:
+        for label, path in pdfs:
+            result = run_pdf(label, path, base_url, work_dir, args)
+            results["scenarios"][label] = result
+            print(summarize(result))
+            print(summarize_section_modes(label, result["stages"]["transform"]))
+    finally:
+        server.shutdown()
+        if args.keep:
+            print(f"Working files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Benchmark every pipeline stage against one PDF in a fresh process.
+
+Run by bench.run, which points OPENAI_BASE_URL at the fake server and
+gives each scenario its own index, cache and history paths so nothing is
+warm from an earlier run. Peak RSS is per process, which is why each
+scenario gets its own.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.synthetic import synthetic_diagnosis, synthetic_note
+
+API_KEY = "sk-bench"
+
+
+def percentiles(samples):
+    """Summary of latencies in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": rank(50),
+        "p90_ms": rank(90),
+        "p95_ms": rank(95),
+        "p99_ms": rank(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its reaped children (e.g. PDF workers)"""
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20,
+    }
+
+
+def resident_mb():
+    """Current private (anonymous) and shared file-backed resident memory; Linux only"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            fields = dict(line.split(":", 1) for line in file if line.startswith(("RssAnon", "RssFile")))
+    except OSError:
+        return None
+    return {"anon": int(fields["RssAnon"].split()[0]) / 1024, "file": int(fields["RssFile"].split()[0]) / 1024}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_concurrent(fn, jobs, concurrency):
+    """Run fn(*job) for every job on a thread pool; return (latencies, wall seconds)"""
+    def one(job):
+        return timed(fn, *job)[1]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, jobs))
+    return latencies, time.perf_counter() - start
+
+
+def run_scenario(pdf_path, top_ks, queries, note_words, transform_runs, concurrencies, index_type):
+    # app runs in Streamlit's bare mode here: widgets are no-ops and session_state is a plain dict
+    import streamlit as st
+
+    import app
+    import dsm_index
+    from dsm_index import CHUNK_OVERLAP, CHUNK_SIZE, DEFAULT_EMBEDDING_MODELS, get_dsm_index
+    from embedding_pipeline import BatchedEmbeddings
+    from dsm_structure import iter_dsm_chunks
+    from pdf_extract import iter_pdf_pages
+
+    result = {"pdf": os.path.basename(pdf_path), "pdf_bytes": os.path.getsize(pdf_path), "stages": {}}
+    stages = result["stages"]
+
+    pages, seconds = timed(lambda: list(iter_pdf_pages(pdf_path)))
+    stages["extraction"] = {"seconds": seconds, "pages": len(pages),
+                            "chars": sum(len(text) for _, text in pages), "peak_rss_mb": peak_rss_mb()}
+
+    documents, seconds = timed(lambda: list(iter_dsm_chunks(pages, CHUNK_SIZE, CHUNK_OVERLAP)))
+    stages["chunking"] = {"seconds": seconds, "chunks": len(documents), "peak_rss_mb": peak_rss_mb()}
+
+    # Raw embedding throughput, no cache involved
+    embeddings = BatchedEmbeddings(API_KEY, DEFAULT_EMBEDDING_MODELS["openai"], cache_path=None)
+    _, seconds = timed(embeddings.embed_documents, [doc.page_content for doc in documents])
+    stages["embedding"] = {"seconds": seconds, "chunks_per_second": len(documents) / seconds if seconds else None,
+                           "peak_rss_mb": peak_rss_mb()}
+    del pages, documents
+
+    # Cold build: extraction, chunking, embedding, FAISS and BM25, persisted to disk
+    (retriever, chunk_count), seconds = timed(get_dsm_index, API_KEY, build=True, pdf_path=pdf_path,
+                                             index_type=index_type)
+    stages["index_build"] = {"seconds": seconds, "chunks": chunk_count, "index_type": index_type,
+                             "peak_rss_mb": peak_rss_mb()}
+
+    # Warm start: what a new server process pays to load the persisted index
+    dsm_index._indexes.clear()
+    before = resident_mb()
+    (retriever, _), seconds = timed(get_dsm_index, API_KEY, build=False, pdf_path=pdf_path, index_type=index_type)
+    after = resident_mb()
+    # Mapped vectors and texts show up as shared file pages, not private memory
+    loaded = {kind: after[kind] - before[kind] for kind in after} if before and after else None
+    stages["index_load"] = {"seconds": seconds, "resident_mb": loaded, "peak_rss_mb": peak_rss_mb()}
+
+    st.session_state["openai_api_key"] = API_KEY
+    st.session_state.dsm_knowledge_base = retriever
+    st.session_state.dsm_loaded = True
+
+    query_jobs = [(synthetic_diagnosis(i), synthetic_note(80, i)) for i in range(queries)]
+    app.query_dsm_knowledge(*query_jobs[0])  # warm-up: first call pays for lazy imports
+    stages["query"] = {}
+    for top_k in top_ks:
+        latencies = [timed(app.query_dsm_knowledge, diagnosis, note, top_k)[1] for diagnosis, note in query_jobs]
+        stages["query"][f"top_k={top_k}"] = percentiles(latencies)
+    stages["query"]["peak_rss_mb"] = peak_rss_mb()
+
+    stages["transform"] = {}
+    for words in note_words:
+        notes = [(synthetic_note(words, i), synthetic_diagnosis(i)) for i in range(transform_runs)]
+        entry = {}
+        for concurrency in concurrencies:
+            jobs = [(note, diagnosis, "SOAP", API_KEY, False) for note, diagnosis in notes]
+            latencies, wall = run_concurrent(app.transform_note_with_gpt, jobs, concurrency)
+            entry[f"concurrency={concurrency}"] = dict(percentiles(latencies),
+                                                       notes_per_second=len(jobs) / wall if wall else None)
+        # Same inputs again: served from the response cache
+        jobs = [(note, diagnosis, "SOAP", API_KEY, True) for note, diagnosis in notes]
+        entry["cached"] = percentiles([timed(app.transform_note_with_gpt, *job)[1] for job in jobs])
+        entry["section_modes"] = compare_section_modes(app, notes)
+        stages["transform"][f"note_words={words}"] = entry
+    stages["transform"]["peak_rss_mb"] = peak_rss_mb()
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def compare_section_modes(app, notes):
+    """Latency and tokens per note: one single-shot request vs one concurrent request per section"""
+    result = {}
+    for mode, parallel_sections in (("single", False), ("parallel_sections", True)):
+        latencies = []
+        tokens = {"prompt_tokens": 0, "completion_tokens": 0}
+        for note, diagnosis in notes:
+            timings = {}
+            latencies.append(timed(app.transform_note_with_gpt, note, diagnosis, "SOAP", API_KEY, False, timings,
+                                   parallel_sections)[1])
+            for key in tokens:
+                tokens[key] += timings.get("usage", {}).get(key, 0)
+        result[mode] = dict(percentiles(latencies),
+                            **{f"{key}_per_note": value / len(notes) for key, value in tokens.items()})
+    return result
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark one PDF (normally run by bench.run)")
+    parser.add_argument("pdf")
+    parser.add_argument("output", help="Path of the JSON result")
+    parser.add_argument("--top-k", type=_int_list, default=[1, 3, 5, 10])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--note-words", type=_int_list, default=[150, 1500])
+    parser.add_argument("--transform-runs", type=int, default=16)
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8])
+    parser.add_argument("--index-type", default="flat")
+    args = parser.parse_args(argv)
+    result = run_scenario(args.pdf, args.top_k, args.queries, args.note_words, args.transform_runs,
+                          args.concurrency, args.index_type)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Seeded generators for large DSM-style PDFs and long clinical notes.
+
+    python -m bench.synthetic pdf out.pdf --pages 800
+    python -m bench.synthetic note --words 5000
+    python -m bench.synthetic queries queries.jsonl --pages 800
+"""
+import argparse
+import json
+import random
+
+LINES_PER_PAGE = 48
+LINE_CHARS = 95
+
+_QUALIFIERS = ["Persistent", "Acute", "Generalized", "Recurrent", "Substance-Induced", "Other Specified",
+               "Unspecified", "Major", "Mild", "Childhood-Onset", "Adjustment", "Social", "Separation"]
+_SUBJECTS = ["Anxiety", "Mood", "Sleep-Wake", "Attention", "Eating", "Trauma", "Panic", "Depressive",
+             "Obsessive", "Somatic Symptom", "Conduct", "Communication", "Personality", "Stress"]
+_CRITERIA = [
+    "Marked and persistent fear or anxiety about {topic} lasting at least {months} months.",
+    "The disturbance causes clinically significant distress or impairment in social, occupational, or other important areas of functioning.",
+    "Symptoms are present more days than not and include {symptom} and {symptom2}.",
+    "The disturbance is not attributable to the physiological effects of a substance or another medical condition.",
+    "The individual finds it difficult to control the {topic}, which is associated with {symptom}.",
+    "Onset occurs before age {age}, and at least {count} of the following symptoms are present.",
+    "Specify if: with {specifier}, with poor insight, in partial remission, or in full remission.",
+]
+_TOPICS = ["social situations", "separation from attachment figures", "everyday events", "bodily sensations",
+           "performance situations", "intrusive thoughts", "sleep onset", "food intake", "traumatic reminders"]
+_SYMPTOMS = ["restlessness", "fatigue", "irritability", "muscle tension", "sleep disturbance",
+             "difficulty concentrating", "low mood", "anhedonia", "hypervigilance", "avoidance behavior",
+             "intrusive memories", "psychomotor agitation", "appetite change", "feelings of worthlessness"]
+_SPECIFIERS = ["anxious distress", "mixed features", "panic attacks", "seasonal pattern", "peripartum onset"]
+_NOTE_SENTENCES = [
+    "Client reported {symptom} over the past {days} days and rated distress at {rating}/10.",
+    "Client described {topic} as the main trigger this week.",
+    "Therapist used {technique}; client was able to identify two alternative thoughts.",
+    "Client stated sleep was {hours} hours per night with frequent waking.",
+    "Client practiced {technique} in session and reported distress decreased from {rating}/10 to {lower}/10.",
+    "Homework from last session was partially completed; client noted {symptom} interfered.",
+    "Client denied suicidal ideation, intent or plan.",
+    "Client's partner has noticed {symptom} at home, which client finds frustrating.",
+]
+_TECHNIQUES = ["cognitive restructuring", "diaphragmatic breathing", "behavioral activation",
+               "graded exposure", "progressive muscle relaxation", "mindfulness grounding"]
+
+
+def synthetic_disorders(count=200, seed=0):
+    """Return [(name, icd10_code)] for made-up but DSM-shaped disorders"""
+    rng = random.Random(seed)
+    disorders = []
+    seen = set()
+    while len(disorders) < count:
+        name = f"{rng.choice(_QUALIFIERS)} {rng.choice(_SUBJECTS)} Disorder"
+        if name in seen:
+            name = f"{name} Type {len(disorders)}"
+        seen.add(name)
+        disorders.append((name, f"F{rng.randint(10, 99)}.{rng.randint(0, 9)}"))
+    return disorders
+
+
+def _criterion(rng):
+    return rng.choice(_CRITERIA).format(
+        topic=rng.choice(_TOPICS), symptom=rng.choice(_SYMPTOMS), symptom2=rng.choice(_SYMPTOMS),
+        months=rng.randint(1, 12), age=rng.randint(6, 40), count=rng.randint(2, 6),
+        specifier=rng.choice(_SPECIFIERS),
+    )
+
+
+def _wrap(text, width=LINE_CHARS):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def synthetic_page_lines(pages, seed=0):
+    """Yield one list of text lines per page of DSM-style criteria text"""
+    rng = random.Random(seed)
+    disorders = synthetic_disorders(seed=seed)
+    lines = []
+    while pages:
+        name, code = rng.choice(disorders)
+        lines.extend([name, f"Diagnostic Criteria {code}"])
+        for letter in "ABCDEF"[:rng.randint(3, 6)]:
+            lines.extend(_wrap(f"{letter}. {_criterion(rng)} {_criterion(rng)}"))
+        lines.append("")
+        while len(lines) >= LINES_PER_PAGE and pages:
+            yield lines[:LINES_PER_PAGE]
+            lines = lines[LINES_PER_PAGE:]
+            pages -= 1
+
+
+def _pdf_string(text):
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped.encode('latin-1', 'replace').decode('latin-1')})"
+
+
+def write_synthetic_pdf(path, pages, seed=0):
+    """Write a text PDF of ``pages`` pages that PyPDF2 can extract"""
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in synthetic_page_lines(pages, seed):
+        text_ops = " T* ".join(f"{_pdf_string(line)} Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 13 TL 40 760 Td {text_ops} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    with open(path, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            file.write(b"%010d 00000 n \n" % offset)
+        file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return path
+
+
+def synthetic_note(words, seed=0):
+    """A raw clinical note of roughly ``words`` words"""
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < words:
+        rating = rng.randint(4, 9)
+        sentence = rng.choice(_NOTE_SENTENCES).format(
+            symptom=rng.choice(_SYMPTOMS), topic=rng.choice(_TOPICS), technique=rng.choice(_TECHNIQUES),
+            days=rng.randint(2, 14), hours=rng.randint(3, 7), rating=rating, lower=rating - rng.randint(1, 3),
+        )
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def synthetic_diagnosis(seed=0):
+    """A diagnosis line naming one of the synthetic disorders and its code"""
+    name, code = random.Random(seed).choice(synthetic_disorders())
+    return f"{name} ({code})"
+
+
+def synthetic_queries(count, pages, seed=0):
+    """Labeled retrieval queries for the PDF written by write_synthetic_pdf(path, pages, seed).
+
+    Each asks about a disorder that appears in that PDF, phrased as the
+    full name with its code, the bare code, or a loose lowercase
+    paraphrase that the exact name/code lookup does not catch.
+    """
+    codes = dict(synthetic_disorders(seed=seed))
+    present = list(dict.fromkeys(line for lines in synthetic_page_lines(pages, seed) for line in lines if line in codes))
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(count):
+        name = rng.choice(present)
+        phrasings = [f"{name} ({codes[name]})", codes[name], name.lower().replace(" disorder", " problems")]
+        queries.append({
+            "diagnosis": phrasings[i % len(phrasings)],
+            "note": synthetic_note(60, seed + i),
+            "expected": {"disorders": [name]},
+        })
+    return queries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark inputs")
+    subparsers = parser.add_subparsers(dest="kind", required=True)
+    pdf_parser = subparsers.add_parser("pdf", help="DSM-style PDF")
+    pdf_parser.add_argument("path")
+    pdf_parser.add_argument("--pages", type=int, default=500)
+    pdf_parser.add_argument("--seed", type=int, default=0)
+    note_parser = subparsers.add_parser("note", help="Raw clinical note, printed to stdout")
+    note_parser.add_argument("--words", type=int, default=1000)
+    note_parser.add_argument("--seed", type=int, default=0)
+    queries_parser = subparsers.add_parser("queries", help="Labeled retrieval queries (JSONL) for a synthetic PDF")
+    queries_parser.add_argument("path")
+    queries_parser.add_argument("--pages", type=int, default=500, help="Pages of the PDF the queries are for")
+    queries_parser.add_argument("--count", type=int, default=60)
+    queries_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.kind == "pdf":
+        write_synthetic_pdf(args.path, args.pages, args.seed)
+        print(f"Wrote {args.pages} pages to {args.path}")
+    elif args.kind == "queries":
+        with open(args.path, "w", encoding="utf-8") as file:
+            for query in synthetic_queries(args.count, args.pages, args.seed):
+                file.write(json.dumps(query) + "\n")
+        print(f"Wrote {args.count} queries to {args.path}")
+    else:
+        print(synthetic_note(args.words, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Offline retrieval tuning: sweep chunking, embedding and index settings against labeled queries.
+
+Each query is a diagnosis and note with the DSM-5 chunks it should find,
+given as disorder headings, section headings, ICD-10-CM codes and/or
+pages (any match makes a chunk relevant):
+
+    {"diagnosis": "GAD", "note": "...", "expected": {"disorders": ["Generalized Anxiety Disorder"]}}
+
+For every combination of chunk size, overlap, embedding backend and index
+type the index is built from scratch, then every top_k is scored by
+recall@k (share of queries with a relevant chunk in the top k) and MRR,
+next to build time, index size on disk and query latency. The best
+configuration is written to retrieval_config.json, which the app and
+batch runner load at startup.
+
+    python -m bench.tune --queries bench/dsm_queries.jsonl --chunk-sizes 500,1000,1500 --top-k 1,3,5
+    python -m bench.tune --fake-openai --synthetic-pages 200
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from bench.run import git_commit
+from bench.scenario import percentiles
+from retrieval_config import DEFAULT_RETRIEVAL_CONFIG, RETRIEVAL_CONFIG_PATH, save_retrieval_config
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DSM_PDF = os.path.join(REPO_ROOT, "APA_DSM-5-Contents.pdf")
+DSM_QUERIES = os.path.join(REPO_ROOT, "bench", "dsm_queries.jsonl")
+METRICS = ["recall", "mrr"]
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def is_relevant(metadata, expected):
+    """Whether a chunk's metadata matches any expected disorder, section, code or page"""
+    from dsm_structure import normalize_diagnosis
+
+    def overlaps(wanted, present):
+        return bool({normalize_diagnosis(value) for value in wanted} & {normalize_diagnosis(value) for value in present})
+
+    if overlaps(expected.get("disorders", []), metadata.get("disorders", [])):
+        return True
+    if overlaps(expected.get("sections", []), [metadata.get("section") or ""]):
+        return True
+    if overlaps(expected.get("codes", []), metadata.get("icd10_codes", [])):
+        return True
+    return any(metadata["page_start"] <= page <= metadata["page_end"] for page in expected.get("pages", []))
+
+
+def score_top_k(retriever, queries, k):
+    """recall@k, MRR within the top k, and per-query latency percentiles.
+
+    Every (configuration, top_k) run starts equally cold: queries are
+    embedded afresh, as a first lookup of a diagnosis in the app would be,
+    after one untimed request has opened connections or loaded the model.
+    """
+    embeddings = retriever.embeddings
+    retriever._query_vectors.clear()
+    # The on-disk embedding cache is shared by every build in the sweep; left on, it would serve
+    # the queries of every run after the first and bias the latency tie-break toward later configurations
+    disk_cache = getattr(embeddings, "cache", None)
+    if disk_cache is not None:
+        embeddings.cache = None
+    try:
+        embeddings.embed_documents(["warm-up"])
+        hits, reciprocal_ranks, latencies = 0, 0.0, []
+        for query in queries:
+            start = time.perf_counter()
+            documents = retriever.search(query["diagnosis"], query.get("note", ""), k=k)
+            latencies.append(time.perf_counter() - start)
+            rank = next((i for i, doc in enumerate(documents, 1) if is_relevant(doc.metadata, query["expected"])), None)
+            if rank:
+                hits += 1
+                reciprocal_ranks += 1 / rank
+    finally:
+        if disk_cache is not None:
+            embeddings.cache = disk_cache
+    latency = percentiles(latencies)
+    return {
+        "recall": hits / len(queries),
+        "mrr": reciprocal_ranks / len(queries),
+        "p50_ms": latency["p50_ms"],
+        "p95_ms": latency["p95_ms"],
+    }
+
+
+def directory_mb(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file()) / 2 ** 20
+
+
+def evaluate(pdf_path, queries, api_key, chunk_size, chunk_overlap, embedding_backend, index_type, top_ks):
+    """Build one configuration and score every top_k; return one result row per top_k"""
+    import dsm_index
+
+    config = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+              "embedding_backend": embedding_backend, "index_type": index_type}
+    start = time.perf_counter()
+    retriever, chunk_count = dsm_index.get_dsm_index(
+        api_key, build=True, pdf_path=pdf_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+        embedding_backend=embedding_backend, index_type=index_type)
+    build_seconds = time.perf_counter() - start
+    key, _ = dsm_index.index_key(pdf_path, chunk_size, chunk_overlap, embedding_backend, index_type=index_type)
+    path = dsm_index._index_path(key)
+    built = {
+        "chunks": chunk_count,
+        "built_index_type": dsm_index._read_manifest(path)["built_index_type"],
+        "build_seconds": build_seconds,
+        "index_mb": directory_mb(path),
+    }
+    return [dict(config, top_k=k, **built, **score_top_k(retriever, queries, k)) for k in top_ks]
+
+
+def choose(rows, metric, tolerance, max_p95_ms=None):
+    """The best-scoring row, preferring fewer chunks, lower latency and a smaller index among near-ties"""
+    candidates = [row for row in rows if "error" not in row]
+    if max_p95_ms is not None:
+        candidates = [row for row in candidates if row["p95_ms"] <= max_p95_ms]
+    if not candidates:
+        return None
+    best = max(row[metric] for row in candidates)
+    near_best = [row for row in candidates if row[metric] >= best - tolerance]
+    return min(near_best, key=lambda row: (row["top_k"], row["p95_ms"], row["index_mb"], -row[metric]))
+
+
+def format_table(rows):
+    header = (f"{'chunk':>6} {'overlap':>7} {'backend':<7} {'index':<6} {'k':>3} {'recall':>6} {'mrr':>6} "
+              f"{'build s':>8} {'MB':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    lines = [header]
+    for row in rows:
+        prefix = (f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['embedding_backend']:<7} "
+                  f"{row['index_type']:<6}")
+        if "error" in row:
+            lines.append(f"{prefix} error: {row['error']}")
+            continue
+        lines.append(f"{prefix} {row['top_k']:>3} {row['recall']:>6.3f} {row['mrr']:>6.3f} "
+                     f"{row['build_seconds']:>8.2f} {row['index_mb']:>7.2f} {row['p50_ms']:>7.1f} {row['p95_ms']:>7.1f}")
+    return "\n".join(lines)
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def _str_list(text):
+    return [value.strip() for value in text.split(",") if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune DSM-5 retrieval settings against labeled queries")
+    parser.add_argument("--pdf", default=DSM_PDF)
+    parser.add_argument("--queries", default=DSM_QUERIES, help="Labeled queries (JSONL)")
+    parser.add_argument("--synthetic-pages", type=int,
+                        help="Tune on a synthetic PDF of this many pages and generated queries instead")
+    parser.add_argument("--synthetic-queries", type=int, default=60)
+    parser.add_argument("--fake-openai", action="store_true",
+                        help="Embed through the local fake server; its bag-of-words vectors never write the config")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--chunk-sizes", type=_int_list, default=[500, 1000, 1500])
+    parser.add_argument("--overlaps", type=_int_list, default=[100, 200])
+    parser.add_argument("--backends", type=_str_list, default=[DEFAULT_RETRIEVAL_CONFIG["embedding_backend"]])
+    parser.add_argument("--index-types", type=_str_list, default=["flat", "hnsw", "sq8"])
+    parser.add_argument("--top-k", type=_int_list, default=[1, 3, 5])
+    parser.add_argument("--metric", choices=METRICS, default="recall")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Scores this close to the best count as ties, broken by top_k, p95 and size")
+    parser.add_argument("--max-p95-ms", type=float, help="Ignore configurations slower than this per query")
+    parser.add_argument("--config", default=RETRIEVAL_CONFIG_PATH, help="Where to write the chosen settings")
+    parser.add_argument("--no-write-config", action="store_true", help="Only report; leave the config alone")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory of built indexes")
+    parser.add_argument("-o", "--output", default="tune-results.json")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.fake_openai:
+        from bench.fake_openai import start_in_thread
+
+        server, base_url = start_in_thread()
+        # Read when openai_client is first imported, which dsm_index defers until an index is built
+        os.environ["OPENAI_BASE_URL"] = base_url
+        args.api_key = args.api_key or "sk-tune"
+    if not args.api_key and "openai" in args.backends:
+        parser.error("the openai backend needs --api-key or OPENAI_API_KEY")
+
+    import dsm_index
+
+    work_dir = tempfile.mkdtemp(prefix="mental-note-tune-")
+    # Every configuration is built fresh, but the builds share one embedding cache in here;
+    # score_top_k() bypasses it so that query latency is measured cold for each configuration
+    dsm_index.INDEX_DIR = os.path.join(work_dir, "index")
+    pdf_path = args.pdf
+    if args.synthetic_pages:
+        from bench.synthetic import synthetic_queries, write_synthetic_pdf
+
+        pdf_path = os.path.join(work_dir, f"synthetic-{args.synthetic_pages}p.pdf")
+        write_synthetic_pdf(pdf_path, args.synthetic_pages)
+        queries = synthetic_queries(args.synthetic_queries, args.synthetic_pages)
+    else:
+        queries = load_queries(args.queries)
+
+    rows = []
+    print(format_table([]), flush=True)
+    try:
+        for chunk_size, chunk_overlap, backend, index_type in itertools.product(
+                args.chunk_sizes, args.overlaps, args.backends, args.index_types):
+            if chunk_overlap >= chunk_size:
+                continue
+            try:
+                config_rows = evaluate(pdf_path, queries, args.api_key, chunk_size, chunk_overlap, backend,
+                                       index_type, args.top_k)
+            except Exception as e:
+                config_rows = [{"chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                                "embedding_backend": backend, "index_type": index_type, "error": str(e)}]
+            finally:
+                # Release the mapped files before the next build
+                dsm_index._indexes.clear()
+            rows.extend(config_rows)
+            print(format_table(config_rows).split("\n", 1)[1], flush=True)
+    finally:
+        if server:
+            server.shutdown()
+        if args.keep:
+            print(f"Working files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    chosen = choose(rows, args.metric, args.tolerance, args.max_p95_ms)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "pdf": os.path.basename(pdf_path),
+            "queries": len(queries),
+            "args": vars(args),
+        },
+        "results": rows,
+        "chosen": chosen,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote {args.output}")
+
+    if chosen is None:
+        print("No configuration met the constraints; config left unchanged")
+        return
+    print(f"Chosen: chunk_size={chosen['chunk_size']} chunk_overlap={chosen['chunk_overlap']} "
+          f"embedding_backend={chosen['embedding_backend']} index_type={chosen['index_type']} "
+          f"top_k={chosen['top_k']} ({args.metric} {chosen[args.metric]:.3f}, p95 {chosen['p95_ms']:.1f}ms)")
+    if args.fake_openai or args.no_write_config:
+        # Bag-of-words embeddings say nothing about real vector quality, so they never set the app's defaults
+        print("Config not written")
+        return
+    evaluation = {key: chosen[key] for key in ("recall", "mrr", "p50_ms", "p95_ms", "index_mb", "chunks")}
+    evaluation.update(metric=args.metric, queries=len(queries), pdf=os.path.basename(pdf_path))
+    save_retrieval_config(chosen, args.config, evaluation)
+    print(f"Wrote {args.config}")
+
+
+if __name__ == "__main__":
+    main()
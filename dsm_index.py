@@ -0,0 +1,262 @@
+"""Persistent DSM-5 vector index shared by every session in the process.
+
+FAISS, LangChain and the PDF reader are imported inside the functions
+that need them, so importing this module (and the app) stays cheap until
+an index is actually loaded or built. Saved indexes are opened read-only
+through memory maps (see mapped_index), so sessions and worker processes
+serving the same index share its pages instead of each holding a copy.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from metrics import METRICS_ENABLED, get_metrics
+from retrieval_config import load_retrieval_config
+
+DSM_PDF_PATH = "APA_DSM-5-Contents.pdf"
+INDEX_DIR = os.environ.get("DSM_INDEX_DIR", ".dsm_index")
+# Defaults come from retrieval_config.json when the tuning harness has written one
+_tuned = load_retrieval_config()
+CHUNK_SIZE = _tuned["chunk_size"]
+CHUNK_OVERLAP = _tuned["chunk_overlap"]
+# DSM-5 chunks retrieved per note
+DSM_TOP_K = _tuned["top_k"]
+# "openai" embeds through the API; "local" runs a sentence-transformers model on CPU
+EMBEDDING_BACKEND = os.environ.get("DSM_EMBEDDING_BACKEND", _tuned["embedding_backend"])
+DEFAULT_EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "local": "sentence-transformers/all-MiniLM-L6-v2",
+}
+# "flat" (exact float32), "hnsw" (graph), "sq8" (int8 scalar-quantized) or "ivfpq" (product-quantized)
+INDEX_TYPE = os.environ.get("DSM_INDEX_TYPE", _tuned["index_type"])
+INDEX_TYPES = ["flat", "hnsw", "sq8", "ivfpq"]
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+# IVF-PQ needs enough vectors to train its codebooks; smaller corpora use sq8
+IVFPQ_MIN_VECTORS = 4096
+
+# Chunks embedded between progress reports during a build
+EMBEDDING_PROGRESS_CHUNKS = 512
+
+# Bump when the on-disk layout or the cleaning rules change
+INDEX_FORMAT_VERSION = 4
+
+LEXICAL_INDEX_FILE = "lexical.json"
+
+# Process-wide state: one loaded index per key, shared by all sessions
+_indexes = {}
+_index_lock = threading.Lock()
+_pdf_hashes = {}
+
+
+def file_sha256(path):
+    """Hash a file's contents, memoized on (path, size, mtime)"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _pdf_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        _pdf_hashes[memo_key] = digest.hexdigest()
+    return _pdf_hashes[memo_key]
+
+
+def index_key(pdf_path=DSM_PDF_PATH, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+              embedding_backend=EMBEDDING_BACKEND, embedding_model=None, index_type=INDEX_TYPE):
+    """Return the cache key identifying an index built from these inputs"""
+    params = {
+        "format": INDEX_FORMAT_VERSION,
+        "pdf_sha256": file_sha256(pdf_path),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_backend": embedding_backend,
+        "embedding_model": embedding_model or DEFAULT_EMBEDDING_MODELS[embedding_backend],
+        "index_type": index_type,
+    }
+    blob = json.dumps(params, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16], params
+
+
+def get_embeddings(api_key, embedding_backend=EMBEDDING_BACKEND, embedding_model=None):
+    """Create the embedding backend used for building and querying the index"""
+    from embedding_pipeline import BatchedEmbeddings, LocalEmbeddings
+
+    embedding_model = embedding_model or DEFAULT_EMBEDDING_MODELS[embedding_backend]
+    if embedding_backend == "local":
+        return LocalEmbeddings(embedding_model)
+    return BatchedEmbeddings(api_key, embedding_model,
+                             cache_path=os.path.join(INDEX_DIR, "embeddings.sqlite"))
+
+
+def make_faiss_index(vectors, index_type):
+    """Build and fill a FAISS index of the requested type; return (index, actual_type)"""
+    import faiss
+    import numpy as np
+
+    count, dim = vectors.shape
+    if index_type == "ivfpq" and count < IVFPQ_MIN_VECTORS:
+        index_type = "sq8"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_NEIGHBORS)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type == "ivfpq":
+        nlist = max(1, int(4 * np.sqrt(count)))
+        # Sub-quantizers must divide the dimension; aim for ~8 dims per code byte
+        subquantizers = max(m for m in range(1, dim // 8 + 1) if dim % m == 0)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, subquantizers, 8)
+        index.nprobe = min(nlist, IVF_NPROBE)
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index, index_type
+
+
+def build_vectorstore(documents, embeddings, index_type=INDEX_TYPE, progress=None):
+    """Embed documents and wrap a FAISS index of the given type as a LangChain vectorstore.
+
+    ``progress("embedding", done, total)`` is called as chunks are embedded.
+    """
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    texts = [doc.page_content for doc in documents]
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_PROGRESS_CHUNKS):
+        vectors.extend(embeddings.embed_documents(texts[start:start + EMBEDDING_PROGRESS_CHUNKS]))
+        if progress:
+            progress("embedding", len(vectors), len(texts))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index, actual_type = make_faiss_index(vectors, index_type)
+    ids = [str(i) for i in range(len(documents))]
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+    return vectorstore, actual_type
+
+
+def _report_pages(pages, total, progress):
+    for page in pages:
+        progress("extracting", page[0], total)
+        yield page
+
+
+def load_dsm_documents(pdf_path=DSM_PDF_PATH, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, progress=None):
+    """Extract, clean and split the DSM-5 manual into page-tagged documents.
+
+    ``progress("extracting", page_no, page_count)`` is called per page.
+    """
+    from dsm_structure import iter_dsm_chunks
+    from pdf_extract import count_pdf_pages, iter_pdf_pages
+
+    pages = iter_pdf_pages(pdf_path)
+    if progress:
+        pages = _report_pages(pages, count_pdf_pages(pdf_path), progress)
+    return list(iter_dsm_chunks(pages, chunk_size, chunk_overlap))
+
+
+def _index_path(key):
+    return os.path.join(INDEX_DIR, key)
+
+
+def _read_manifest(path):
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def _save_index(vectorstore, documents, key, params, built_index_type):
+    """Write the mapped index and BM25 index to a temp dir and swap it into place atomically"""
+    from hybrid_retrieval import BM25Index
+    from mapped_index import save_mapped_index
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f".{key}-", dir=INDEX_DIR)
+    try:
+        # Documents are in FAISS position order, which is also the BM25 doc id order
+        save_mapped_index(tmp_path, vectorstore.index, documents)
+        BM25Index.build(doc.page_content for doc in documents).save(os.path.join(tmp_path, LEXICAL_INDEX_FILE))
+        manifest = dict(params, key=key, chunk_count=len(documents), built_index_type=built_index_type,
+                        created=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        with open(os.path.join(tmp_path, "manifest.json"), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+        final_path = _index_path(key)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        # Processes still serving the old files keep their mappings; unlinked inodes stay valid
+        os.replace(tmp_path, final_path)
+        return manifest
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def get_dsm_index(api_key, build=True, pdf_path=DSM_PDF_PATH, chunk_size=CHUNK_SIZE,
+                  chunk_overlap=CHUNK_OVERLAP, embedding_backend=EMBEDDING_BACKEND,
+                  embedding_model=None, index_type=INDEX_TYPE, progress=None):
+    """Return (retriever, chunk_count) for the current inputs, or None.
+
+    Lookup order is the in-process cache, then the on-disk index, then a
+    fresh build (only when build=True). A build is persisted so that later
+    processes load it instead of re-embedding the manual, and is then
+    reopened from disk like any other saved index. The retriever is a
+    HybridRetriever over the memory-mapped FAISS store and its BM25 index.
+
+    ``progress(stage, done, total)`` is called with stage "loading",
+    "extracting", "embedding" or "indexing" as the work advances.
+    """
+    from hybrid_retrieval import BM25Index, HybridRetriever
+    from mapped_index import has_mapped_index, load_mapped_index
+
+    key, params = index_key(pdf_path, chunk_size, chunk_overlap, embedding_backend, embedding_model, index_type)
+    with _index_lock:
+        if key in _indexes:
+            return _indexes[key]
+
+        path = _index_path(key)
+        manifest = _read_manifest(path)
+        missing = manifest is None or not has_mapped_index(path)
+        if missing and not build:
+            return None
+        start = time.perf_counter()
+        # Only once we know we will load or build: a local backend loads its model here,
+        # and the app probes with build=False on every rerun until an index exists
+        embeddings = get_embeddings(api_key, embedding_backend, embedding_model)
+        if missing:
+            documents = load_dsm_documents(pdf_path, chunk_size, chunk_overlap, progress)
+            vectorstore, built_index_type = build_vectorstore(documents, embeddings, index_type, progress)
+            if progress:
+                progress("indexing", 0, 0)
+            manifest = _save_index(vectorstore, documents, key, params, built_index_type)
+            # Drop the in-memory copies; the mapped files below serve the same data
+            del documents, vectorstore
+
+        if progress:
+            progress("loading", 0, 0)
+        vectorstore = load_mapped_index(path, embeddings)
+        lexical_index = BM25Index.load(os.path.join(path, LEXICAL_INDEX_FILE))
+        _indexes[key] = (HybridRetriever(vectorstore, lexical_index), manifest["chunk_count"])
+        # Only real loads and builds: cache hits and build=False probes would drag the percentiles down
+        if METRICS_ENABLED:
+            get_metrics().observe("knowledge_base", time.perf_counter() - start)
+        return _indexes[key]
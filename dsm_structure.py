@@ -0,0 +1,198 @@
+"""Structure-aware DSM-5 chunking and diagnosis/ICD-10-CM code normalization.
+
+Page text keeps its line breaks, so disorder and section headings can be
+found line by line. Each heading starts a block that runs to the next
+heading; small blocks are packed together up to the chunk size and large
+ones are split on paragraph and line boundaries with the heading repeated,
+so a chunk never straddles two disorders unless both are short.
+"""
+import re
+
+# APA running headers, e.g. "12 • DSM-5 Table of Contents" / "DSM-5 Table of Contents • 13"
+RUNNING_HEADER_RE = re.compile(r"^\s*(?:\d{1,4}\s*•\s*DSM-5 Table of Contents|DSM-5 Table of Contents\s*•\s*\d{1,4})\s*")
+# ICD-10-CM codes as printed in DSM-5: F41.1, F10.20, Z63.0, G47.00, or a bare category in parentheses (F99)
+ICD10_CODE_RE = re.compile(r"\b([EFGRTZ]\d{2}(?:\.[0-9A-Z]{1,4}|(?=\))))", re.IGNORECASE)
+MAX_HEADING_CHARS = 120
+MAX_HEADING_WORDS = 14
+
+# Lowercase words allowed inside a Title Case heading
+_HEADING_SMALL_WORDS = frozenset(
+    "a an and as at by due for from in of on or the to with without".split()
+)
+# Title Case lines that introduce criteria rather than name a disorder
+_NOT_HEADINGS = ("diagnostic criteria", "specify", "note", "coding note", "criterion")
+_SECTION_SUFFIXES = ("disorders", "dysfunctions")
+_PARENTHETICAL_RE = re.compile(r"\(([^)]*)\)")
+# Parentheticals that qualify a heading instead of naming the condition
+_ALIAS_STOPWORDS = ("specifier", "previously")
+
+
+def clean_page_lines(text):
+    """Split a page into cleaned lines, keeping symbols such as / % ( ) [ ] and the line structure"""
+    text = RUNNING_HEADER_RE.sub("", text)
+    text = text.replace("–", "-").replace("—", "-").replace("’", "'").replace(" ", " ")
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"[ \t\f\v]+", " ", line).strip()
+        line = "".join(char for char in line if char.isprintable())
+        if line and not line.isdigit():  # bare page numbers
+            lines.append(line)
+    return lines
+
+
+def is_heading(line):
+    """True for short Title Case lines such as "Generalized Anxiety Disorder" or "Section II: ..." """
+    if len(line) > MAX_HEADING_CHARS or line[-1] in ".,;" or not line[0].isupper():
+        return False
+    if line.lower().startswith(_NOT_HEADINGS):
+        return False
+    words = _PARENTHETICAL_RE.sub(" ", line).replace("/", " ").replace("-", " ").split()
+    if not words or len(words) > MAX_HEADING_WORDS:
+        return False
+    for word in words:
+        letters = word.strip(",:'")
+        if letters and letters[0].isalpha() and not letters[0].isupper() and letters.lower() not in _HEADING_SMALL_WORDS:
+            return False
+    return True
+
+
+def is_section_heading(line):
+    """Chapter-level headings, e.g. "Anxiety Disorders" or "Section II: Diagnostic Criteria and Codes" """
+    return line.startswith("Section ") or line.lower().rstrip(" :").endswith(_SECTION_SUFFIXES)
+
+
+def find_icd10_codes(text):
+    """ICD-10-CM codes in text, uppercased, in order of first appearance"""
+    return list(dict.fromkeys(code.upper() for code in ICD10_CODE_RE.findall(text)))
+
+
+def normalize_diagnosis(text):
+    """Lowercase words only: "Tourette's Disorder" and "tourettes disorder" normalize alike"""
+    text = text.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text)  # keep dots only inside codes like f41.1
+    return " ".join(re.sub(r"[^a-z0-9.]+", " ", text).split())
+
+
+def name_keys(name):
+    """Normalized lookup keys for a disorder heading, including aliases in trailing parentheses.
+
+    A comma qualifier is also dropped, so "Major Depressive Disorder, Single
+    and Recurrent Episodes" is found as "Major Depressive Disorder".
+    """
+    head = name.split(",", 1)[0]
+    keys = {normalize_diagnosis(name), normalize_diagnosis(_PARENTHETICAL_RE.sub(" ", name)),
+            normalize_diagnosis(head), normalize_diagnosis(_PARENTHETICAL_RE.sub(" ", head))}
+    trailing = re.search(r"\(([^)]*)\)\s*$", name)
+    if trailing and not any(word in trailing.group(1).lower() for word in _ALIAS_STOPWORDS):
+        keys.add(normalize_diagnosis(trailing.group(1)))
+    return {key for key in keys if key}
+
+
+def code_keys(code):
+    """Lookup keys for an ICD-10-CM code: with and without the dot"""
+    code = code.lower()
+    return {code, code.replace(".", "")}
+
+
+class _Block:
+    """A heading and the lines under it, each line tagged with its page number"""
+
+    def __init__(self, heading, section, page_no):
+        self.heading = heading
+        self.section = section
+        self.lines = [(page_no, heading)] if heading else []
+
+    @property
+    def size(self):
+        return sum(len(text) + 1 for _, text in self.lines)
+
+
+def _iter_blocks(pages):
+    section = None
+    block = _Block(None, None, None)
+    for page_no, text in pages:
+        for line in clean_page_lines(text):
+            if is_heading(line):
+                if block.lines:
+                    yield block
+                if is_section_heading(line):
+                    section = line
+                block = _Block(line, section, page_no)
+            else:
+                block.lines.append((page_no, line))
+    if block.lines:
+        yield block
+
+
+def _make_document(blocks, text, page_start, page_end, source, codes=None):
+    from langchain.schema import Document
+
+    headings = [block.heading for block in blocks if block.heading]
+    return Document(page_content=text, metadata={
+        "source": source,
+        "page_start": page_start,
+        "page_end": page_end,
+        "section": blocks[0].section,
+        "disorders": [heading for heading in headings if not is_section_heading(heading)] or headings,
+        "icd10_codes": find_icd10_codes(text) if codes is None else codes,
+    })
+
+
+def _split_block(block, chunk_size, chunk_overlap, source):
+    """Split an oversized block on paragraph/line/sentence boundaries, repeating its heading"""
+    import bisect
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    body_lines = block.lines[1:] if block.heading else block.lines
+    prefix = f"{block.heading}\n" if block.heading else ""
+    offsets, body = [], ""
+    for page_no, text in body_lines:
+        offsets.append(len(body))
+        body += text + "\n"
+    pages = [page_no for page_no, _ in body_lines]
+    # Every piece belongs to the same disorder, so each carries the block's codes
+    codes = find_icd10_codes(body)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=max(chunk_size - len(prefix), chunk_size // 2),
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True,
+    )
+    for piece in splitter.create_documents([body]):
+        start = piece.metadata["start_index"]
+        end = start + len(piece.page_content) - 1
+        page_start = pages[max(0, bisect.bisect_right(offsets, start) - 1)]
+        page_end = pages[max(0, bisect.bisect_right(offsets, end) - 1)]
+        yield _make_document([block], prefix + piece.page_content, page_start, page_end, source, codes)
+
+
+def iter_dsm_chunks(pages, chunk_size, chunk_overlap, source="DSM-5"):
+    """Split streamed (page_no, text) pairs into Documents that follow DSM headings.
+
+    Metadata carries page_start/page_end, the enclosing section, the
+    disorder headings in the chunk and any ICD-10-CM codes in its text.
+    Consecutive short blocks in the same section share a chunk; only
+    blocks longer than ``chunk_size`` are split (with ``chunk_overlap``).
+    Memory use is bounded by the largest block, not the document.
+    """
+    pending = []
+
+    def flush():
+        text = "\n".join(line for block in pending for _, line in block.lines)
+        document = _make_document(pending, text, pending[0].lines[0][0], pending[-1].lines[-1][0], source)
+        pending.clear()
+        return document
+
+    for block in _iter_blocks(pages):
+        if block.size > chunk_size:
+            if pending:
+                yield flush()
+            yield from _split_block(block, chunk_size, chunk_overlap, source)
+            continue
+        starts_section = block.heading is not None and is_section_heading(block.heading)
+        if pending and (starts_section or sum(b.size for b in pending) + block.size > chunk_size):
+            yield flush()
+        pending.append(block)
+    if pending:
+        yield flush()
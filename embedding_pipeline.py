@@ -0,0 +1,155 @@
+"""Batched, concurrent embedding with retry and a content-addressed SQLite cache"""
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from openai_client import call_with_retries, get_openai_client
+
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(".dsm_index", "embeddings.sqlite"))
+
+
+def embedding_cache_key(text, model):
+    """Content address of one embedding: sha256 over model and chunk text"""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by embedding_cache_key()"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache"""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Store (key, vector) pairs"""
+        rows = [(key, model, array('f', vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+
+class BatchedEmbeddings(Embeddings):
+    """LangChain embeddings that batch, parallelize, retry and cache requests.
+
+    Only texts missing from the cache are sent to the API. Requests go out
+    in batches of ``batch_size`` with at most ``max_concurrency`` in flight,
+    and 429/5xx/connection errors are retried with the shared backoff
+    policy. ``base_url`` lets a local fake endpoint stand in for OpenAI.
+    """
+
+    def __init__(self, api_key, model, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_concurrency=EMBEDDING_CONCURRENCY, max_retries=EMBEDDING_MAX_RETRIES,
+                 cache_path=EMBEDDING_CACHE_PATH, base_url=None):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.client = get_openai_client(api_key, base_url)
+        self.stats = {"requested": 0, "cached": 0, "embedded": 0, "retries": 0}
+
+    def _count_retry(self, error):
+        self.stats["retries"] += 1
+
+    def _embed_batch(self, texts):
+        response = call_with_retries(self.client.embeddings.create, model=self.model, input=texts,
+                                     max_retries=self.max_retries, on_retry=self._count_retry)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed_documents(self, texts):
+        """Embed texts in input order, hitting the API only for cache misses"""
+        texts = list(texts)
+        keys = [embedding_cache_key(text, self.model) for text in texts]
+        vectors = self.cache.get_many(set(keys)) if self.cache else {}
+        self.stats["requested"] += len(texts)
+        self.stats["cached"] += sum(1 for key in keys if key in vectors)
+
+        # De-duplicate identical chunks before sending them out
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in pending:
+                pending[key] = text
+        pending_keys = list(pending)
+        batches = [pending_keys[i:i + self.batch_size] for i in range(0, len(pending_keys), self.batch_size)]
+
+        def run(batch_keys):
+            embedded = self._embed_batch([pending[key] for key in batch_keys])
+            items = list(zip(batch_keys, embedded))
+            if self.cache:
+                self.cache.put_many(self.model, items)
+            return items
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                for items in pool.map(run, batches):
+                    vectors.update(items)
+            self.stats["embedded"] += len(pending_keys)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        """Embed a single query through the same cache"""
+        return self.embed_documents([text])[0]
+
+
+class LocalEmbeddings(Embeddings):
+    """LangChain embeddings computed in-process with a sentence-transformers model.
+
+    Texts are encoded in batches on CPU and L2-normalized, so no request
+    leaves the machine and a query costs a few milliseconds.
+    """
+
+    def __init__(self, model, batch_size=EMBEDDING_BATCH_SIZE, device="cpu"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("The local embedding backend needs sentence-transformers: "
+                              "pip install sentence-transformers") from e
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self._model = SentenceTransformer(model, device=device)
+
+    def embed_documents(self, texts):
+        vectors = self._model.encode(list(texts), batch_size=self.batch_size,
+                                     normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,281 @@
+"""Hybrid lexical + vector retrieval over the DSM-5 chunks"""
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import faiss
+import numpy as np
+import openai
+
+from dsm_structure import ICD10_CODE_RE, code_keys, find_icd10_codes, name_keys, normalize_diagnosis
+
+# "hybrid" fuses BM25 and vector rankings; "lexical" never calls the embedding API
+RETRIEVAL_MODE = os.environ.get("DSM_RETRIEVAL_MODE", "hybrid")
+RRF_K = 60
+MMR_LAMBDA = 0.7
+QUERY_EMBEDDING_CACHE_SIZE = 512
+# Words kept in the diagnosis-focused query
+DIAGNOSIS_QUERY_WORDS = 24
+
+# DSM-IV-TR codes printed next to ICD-10-CM ones, e.g. "300.02 (F41.1)"
+_DSM_IV_CODE_RE = re.compile(r"\b\d{3}\.\d{1,2}\b")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)?")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the to was were with "
+    "client patient reports reported session".split()
+)
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed; keeps codes like f41.1 intact"""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def diagnosis_query(diagnosis):
+    """Short query built from the primary (first) line of the clinician's diagnosis"""
+    lines = [line.strip() for line in diagnosis.splitlines() if line.strip()]
+    if not lines:
+        return ""
+    return " ".join(lines[0].split()[:DIAGNOSIS_QUERY_WORDS])
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over documents identified by position"""
+
+    def __init__(self, postings, doc_lengths, k1=1.5, b=0.75):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+        return cls(postings, doc_lengths)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"postings": self.postings, "doc_lengths": self.doc_lengths}, file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return cls(data["postings"], data["doc_lengths"])
+
+    def search(self, query, n):
+        """Return up to n (doc_id, score) pairs, best first"""
+        scores = {}
+        doc_count = len(self.doc_lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
+
+
+class DiagnosisIndex:
+    """Exact lookup from normalized disorder names and ICD-10-CM codes to chunk ids"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @classmethod
+    def build(cls, metadatas):
+        """Index (doc_id, metadata) pairs tagged by the DSM chunker"""
+        ranked = {}
+        for doc_id, metadata in metadatas:
+            disorders = metadata.get("disorders") or []
+            # Chunks about a single disorder rank before listings such as the table of contents
+            rank = (len(disorders), doc_id)
+            keys = set()
+            for name in disorders:
+                keys |= name_keys(name)
+            for code in metadata.get("icd10_codes") or []:
+                keys |= code_keys(code)
+            for key in keys:
+                ranked.setdefault(key, []).append(rank)
+        return cls({key: [doc_id for _, doc_id in sorted(ranks)] for key, ranks in ranked.items()})
+
+    def lookup(self, diagnosis):
+        """Chunk ids for the first code or name in the diagnosis's primary line, else []
+
+        A handful of dictionary probes, independent of the corpus size.
+        """
+        line = diagnosis_query(diagnosis)
+        for code in find_icd10_codes(line):
+            ids = self.entries.get(code.lower())
+            if ids:
+                return ids
+        name = ICD10_CODE_RE.sub(" ", _DSM_IV_CODE_RE.sub(" ", line))
+        candidates = [name, re.sub(r"\([^)]*\)", " ", name)] + re.split(r"[,;:()\[\]]| - ", name)
+        for candidate in candidates:
+            ids = self.entries.get(normalize_diagnosis(candidate))
+            if ids:
+                return ids
+        return []
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked lists of doc ids into {doc_id: score}"""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return fused
+
+
+def mmr_select(fused, token_sets, k, lambda_=MMR_LAMBDA):
+    """Pick k ids balancing fused relevance against overlap with chunks already picked.
+
+    Similarity is Jaccard over token sets, which is what catches the
+    overlapping neighbouring chunks the splitter produces.
+    """
+    if not fused:
+        return []
+    top_score = max(fused.values())
+    candidates = dict(fused)
+    selected = []
+    while candidates and len(selected) < k:
+        def mmr_score(doc_id):
+            redundancy = 0.0
+            for chosen in selected:
+                union = token_sets[doc_id] | token_sets[chosen]
+                if union:
+                    redundancy = max(redundancy, len(token_sets[doc_id] & token_sets[chosen]) / len(union))
+            return lambda_ * candidates[doc_id] / top_score - (1 - lambda_) * redundancy
+        best = max(candidates, key=mmr_score)
+        selected.append(best)
+        del candidates[best]
+    return selected
+
+
+class HybridRetriever:
+    """Fuses BM25 over diagnosis and note with vector search on a short diagnosis query.
+
+    A diagnosis that names a DSM-5 disorder or ICD-10-CM code is answered
+    from the DiagnosisIndex first, without embedding anything.
+    """
+
+    def __init__(self, vectorstore, lexical_index, mode=RETRIEVAL_MODE):
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.mode = mode
+        # Shared by every session thread using this retriever
+        self._query_vectors = OrderedDict()
+        self._query_vectors_lock = threading.Lock()
+        self.diagnosis_index = DiagnosisIndex.build(
+            (doc_id, self._metadata(doc_id)) for doc_id in sorted(vectorstore.index_to_docstore_id)
+        )
+
+    @property
+    def embeddings(self):
+        return self.vectorstore.embedding_function
+
+    def document(self, doc_id):
+        return self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[doc_id])
+
+    def _metadata(self, doc_id):
+        docstore = self.vectorstore.docstore
+        if hasattr(docstore, "metadata"):
+            # MappedDocstore: skip decoding every chunk text just to read its tags
+            return docstore.metadata(self.vectorstore.index_to_docstore_id[doc_id])
+        return self.document(doc_id).metadata
+
+    def _embed_queries(self, queries):
+        """Embed queries, reusing vectors for diagnoses seen recently"""
+        with self._query_vectors_lock:
+            vectors = {}
+            for query in queries:
+                if query in self._query_vectors:
+                    self._query_vectors.move_to_end(query)
+                    vectors[query] = self._query_vectors[query]
+        missing = list(dict.fromkeys(query for query in queries if query not in vectors))
+        if missing:
+            # Embedded outside the lock so one slow API call does not stall other sessions' lookups
+            vectors.update(zip(missing, self.embeddings.embed_documents(missing)))
+            with self._query_vectors_lock:
+                for query in missing:
+                    self._query_vectors[query] = vectors[query]
+                    self._query_vectors.move_to_end(query)
+                while len(self._query_vectors) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_vectors.popitem(last=False)
+        return np.asarray([vectors[query] for query in queries], dtype=np.float32)
+
+    def _vector_rankings(self, queries, n):
+        """Rank doc ids for every query with a single FAISS search call"""
+        if self.mode == "lexical":
+            return [[] for _ in queries]
+        try:
+            vectors = self._embed_queries(queries)
+        except openai.APIError:
+            # Offline, timed out or rate limited: carry on with the lexical rankings
+            return [[] for _ in queries]
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            faiss.normalize_L2(vectors)
+        _, ids = self.vectorstore.index.search(vectors, n)
+        return [[int(i) for i in row if i != -1] for row in ids]
+
+    def _fuse(self, diagnosis, raw_note, vector_ranking, k, mmr):
+        n = max(k * 4, 10)
+        focus = diagnosis_query(diagnosis)
+        rankings = [vector_ranking]
+        if self.mode != "vector":
+            rankings.append([doc_id for doc_id, _ in self.lexical_index.search(focus, n)])
+            rankings.append([doc_id for doc_id, _ in self.lexical_index.search(f"{diagnosis} {raw_note}", n)])
+        fused = reciprocal_rank_fusion(rankings)
+        if mmr:
+            candidates = dict(heapq.nlargest(n, fused.items(), key=lambda item: item[1]))
+            documents = {doc_id: self.document(doc_id) for doc_id in candidates}
+            token_sets = {doc_id: set(tokenize(doc.page_content)) for doc_id, doc in documents.items()}
+            return [documents[doc_id] for doc_id in mmr_select(candidates, token_sets, k)]
+        top = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+        return [self.document(doc_id) for doc_id, _ in top]
+
+    def _exact_matches(self, diagnosis, raw_note, k):
+        """Chunks for a diagnosis found in the DiagnosisIndex, topped up from BM25; None if not found"""
+        ids = self.diagnosis_index.lookup(diagnosis)[:k]
+        if not ids:
+            return None
+        if len(ids) < k and self.mode != "vector":
+            for doc_id, _ in self.lexical_index.search(f"{diagnosis} {raw_note}", k * 2):
+                if len(ids) >= k:
+                    break
+                if doc_id not in ids:
+                    ids.append(doc_id)
+        return [self.document(doc_id) for doc_id in ids]
+
+    def search(self, diagnosis, raw_note="", k=3, mmr=True):
+        """Return the k most relevant DSM-5 documents for a note"""
+        exact = self._exact_matches(diagnosis, raw_note, k)
+        if exact is not None:
+            return exact
+        focus = diagnosis_query(diagnosis) or raw_note[:200]
+        vector_ranking = self._vector_rankings([focus], max(k * 4, 10))[0]
+        return self._fuse(diagnosis, raw_note, vector_ranking, k, mmr)
+
+    def batch_search(self, notes, k=3, mmr=True):
+        """search() for many (diagnosis, raw_note) pairs with one vectorized FAISS search"""
+        results = [self._exact_matches(diagnosis, raw_note, k) for diagnosis, raw_note in notes]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            focuses = [diagnosis_query(notes[i][0]) or notes[i][1][:200] for i in pending]
+            vector_rankings = self._vector_rankings(focuses, max(k * 4, 10))
+            for i, vector_ranking in zip(pending, vector_rankings):
+                results[i] = self._fuse(notes[i][0], notes[i][1], vector_ranking, k, mmr)
+        return results
@@ -0,0 +1,84 @@
+"""Background DSM-5 knowledge-base build shared by every session in the process"""
+import os
+import threading
+import time
+
+# Start loading (or building) the index as soon as the first session opens
+KB_AUTOBUILD = os.environ.get("DSM_KB_AUTOBUILD", "1") != "0"
+
+
+class KnowledgeBaseBuilder:
+    """Runs get_dsm_index() on a daemon thread and exposes its progress.
+
+    The work belongs to the server process, not to a browser session, so
+    refreshing the page or opening a second tab attaches to the same build
+    instead of starting over. Once finished, get_dsm_index() returns the
+    cached retriever immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = {"status": "idle"}
+
+    def start(self, api_key, **index_options):
+        """Start the build unless one is running or already done; return True if started"""
+        with self._lock:
+            if self._state["status"] in ("running", "ready"):
+                return False
+            self._state = {"status": "running", "stage": "starting", "done": 0, "total": 0,
+                           "started": time.time()}
+            self._thread = threading.Thread(target=self._run, args=(api_key, index_options),
+                                            name="dsm-kb-build", daemon=True)
+            self._thread.start()
+            return True
+
+    def _progress(self, stage, done, total):
+        with self._lock:
+            self._state.update(stage=stage, done=done, total=total)
+
+    def _run(self, api_key, index_options):
+        try:
+            from dsm_index import get_dsm_index
+            _, chunk_count = get_dsm_index(api_key, build=True, progress=self._progress, **index_options)
+            update = {"status": "ready", "chunk_count": chunk_count}
+        except Exception as e:
+            update = {"status": "failed", "error": str(e)}
+        with self._lock:
+            self._state.update(update, finished=time.time())
+
+    def progress(self):
+        """Snapshot: status (idle/running/ready/failed), stage, done, total, chunk_count or error"""
+        with self._lock:
+            return dict(self._state)
+
+    @property
+    def running(self):
+        return self.progress()["status"] == "running"
+
+
+def describe_progress(state):
+    """One-line description of a running build for the UI"""
+    stage, done, total = state.get("stage"), state.get("done", 0), state.get("total", 0)
+    if stage == "extracting":
+        return f"Extracting pages: {done}/{total}"
+    if stage == "embedding":
+        return f"Embedding chunks: {done}/{total}"
+    if stage == "indexing":
+        return "Building search indexes..."
+    if stage == "loading":
+        return "Loading saved index..."
+    return "Starting..."
+
+
+_shared_builder = None
+_shared_builder_lock = threading.Lock()
+
+
+def get_kb_builder():
+    """Return the process-wide knowledge-base builder"""
+    global _shared_builder
+    with _shared_builder_lock:
+        if _shared_builder is None:
+            _shared_builder = KnowledgeBaseBuilder()
+        return _shared_builder
@@ -0,0 +1,168 @@
+"""Map-reduce preparation of long session transcripts and intake documents.
+
+An upload is read page by page (PDF) or line by line (text) and cut into
+token-bounded segments. Each segment is condensed to a list of clinical
+facts by its own request (map); requests start as soon as their segment
+is cut and run concurrently, so a long transcript takes about as long as
+its slowest segment. Facts are cached by segment content, so re-running
+with another output style or diagnosis goes straight to the final note
+(reduce), which the app builds from the combined facts.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import record_cache, record_usage
+from note_transform import (NOTE_MAX_OUTPUT_TOKENS, NOTE_MODEL, TRUNCATED_FINISH_REASON, NoteTruncatedError,
+                            count_tokens, split_to_tokens)
+from openai_client import call_with_retries, get_openai_client
+from response_cache import get_response_cache
+
+DOCUMENT_TYPES = ["pdf", "txt", "md"]
+DOCUMENT_SEGMENT_TOKENS = int(os.environ.get("DOCUMENT_SEGMENT_TOKENS", "3000"))
+# Trailing lines of a segment repeated at the start of the next, so statements cut at a boundary survive
+DOCUMENT_SEGMENT_OVERLAP_TOKENS = 150
+# Segments in flight at once; with at least as many as the document has, the map step is one request long
+DOCUMENT_MAP_CONCURRENCY = int(os.environ.get("DOCUMENT_MAP_CONCURRENCY", "16"))
+FACTS_MAX_TOKENS = 1000
+# Retry budget for facts cut off at FACTS_MAX_TOKENS: a dense segment's facts can run as long as the segment
+FACTS_RETRY_MAX_TOKENS = max(FACTS_MAX_TOKENS, min(DOCUMENT_SEGMENT_TOKENS, NOTE_MAX_OUTPUT_TOKENS))
+FACTS_TEMPERATURE = 0.0
+NO_FACTS = "None"
+
+FACT_EXTRACTION_PROMPT = f"""You are reading one excerpt of a longer therapy session transcript or clinical intake document.
+List every clinically relevant fact in the excerpt as concise bullet points: reported symptoms with their onset, duration, frequency and severity; emotional states; relevant history, medications and risk factors; therapist observations; interventions used and the client's response; homework, goals and follow-up plans.
+Keep numbers, dates and who said what. Quote the client only where the exact words matter clinically.
+Do not interpret, diagnose or add anything that is not stated in the excerpt.
+If the excerpt contains nothing clinically relevant, answer "{NO_FACTS}"."""
+
+
+def iter_document_lines(source, name):
+    """Yield the text lines of an uploaded PDF (streamed page by page) or UTF-8 text file"""
+    from pdf_extract import iter_pdf_pages
+
+    if name.lower().endswith(".pdf"):
+        for _, text in iter_pdf_pages(source):
+            yield from text.splitlines()
+        return
+    data = source.read() if hasattr(source, "read") else source
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    yield from data.splitlines()
+
+
+def split_segments(lines, max_tokens=DOCUMENT_SEGMENT_TOKENS, overlap_tokens=DOCUMENT_SEGMENT_OVERLAP_TOKENS):
+    """Group lines into segments of at most max_tokens, cutting only between lines.
+
+    Lines longer than a whole segment are cut on token boundaries. Each
+    line is tokenized once, so this stays linear in the document length.
+    """
+    segment, segment_tokens = [], 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        pieces = split_to_tokens(line, max_tokens) if count_tokens(line) > max_tokens else [line]
+        for piece in pieces:
+            tokens = count_tokens(piece) + 1  # newline
+            if segment and segment_tokens + tokens > max_tokens:
+                yield "\n".join(text for text, _ in segment)
+                carry, carried = [], 0
+                for text, size in reversed(segment):
+                    if carried + size > overlap_tokens:
+                        break
+                    carry.insert(0, (text, size))
+                    carried += size
+                segment, segment_tokens = (carry, carried) if carried + tokens <= max_tokens else ([], 0)
+            segment.append((piece, tokens))
+            segment_tokens += tokens
+    if segment:
+        yield "\n".join(text for text, _ in segment)
+
+
+def segment_cache_key(segment):
+    """Hash every input that determines a segment's extracted facts"""
+    blob = json.dumps(["segment_facts", FACT_EXTRACTION_PROMPT, NOTE_MODEL, FACTS_TEMPERATURE,
+                       FACTS_MAX_TOKENS, FACTS_RETRY_MAX_TOKENS, segment])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def extract_segment_facts(segment, api_key, use_cache=True):
+    """Return (facts, usage) for one segment; usage is None when served from the cache.
+
+    Facts cut off at FACTS_MAX_TOKENS are requested once more with
+    FACTS_RETRY_MAX_TOKENS, and usage then sums both requests. If they are
+    still cut off, NoteTruncatedError is raised: incomplete facts are never
+    cached or passed on to the reduce step.
+    """
+    cache = get_response_cache()
+    key = segment_cache_key(segment)
+    if use_cache:
+        facts = cache.get(key)
+        record_cache("segment", facts is not None)
+        if facts is not None:
+            return facts, None
+    client = get_openai_client(api_key)
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    for max_tokens in sorted({FACTS_MAX_TOKENS, FACTS_RETRY_MAX_TOKENS}):
+        response = call_with_retries(
+            client.chat.completions.create,
+            model=NOTE_MODEL,
+            messages=[
+                {"role": "system", "content": FACT_EXTRACTION_PROMPT},
+                {"role": "user", "content": segment},
+            ],
+            max_tokens=max_tokens,
+            temperature=FACTS_TEMPERATURE
+        )
+        record_usage(response.usage)
+        if response.usage:
+            usage["prompt_tokens"] += response.usage.prompt_tokens
+            usage["completion_tokens"] += response.usage.completion_tokens
+        if response.choices[0].finish_reason != TRUNCATED_FINISH_REASON:
+            break
+    else:
+        raise NoteTruncatedError(max_tokens, what="the facts of a document segment",
+                                 remedy="lower DOCUMENT_SEGMENT_TOKENS")
+    facts = response.choices[0].message.content.strip()
+    cache.put(key, facts)
+    return facts, usage
+
+
+def map_segments(segments, api_key, use_cache=True, concurrency=DOCUMENT_MAP_CONCURRENCY, on_progress=None):
+    """Extract facts from every segment concurrently; return (facts in document order, stats).
+
+    ``segments`` may be a generator: each request is submitted as soon as
+    its segment is produced. ``on_progress(done, total)`` is called from
+    the calling thread as segments finish.
+    """
+    stats = {"segments": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(extract_segment_facts, segment, api_key, use_cache) for segment in segments]
+        stats["segments"] = len(futures)
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                _, usage = future.result()
+                if usage is None:
+                    stats["cached"] += 1
+                else:
+                    stats["prompt_tokens"] += usage["prompt_tokens"]
+                    stats["completion_tokens"] += usage["completion_tokens"]
+                if on_progress:
+                    on_progress(done, len(futures))
+        except Exception:
+            pool.shutdown(cancel_futures=True)
+            raise
+    return [future.result()[0] for future in futures], stats
+
+
+def combine_facts(facts, clinician_note=""):
+    """Join per-segment facts, in document order, into the note the reduce pass transforms"""
+    parts = []
+    if clinician_note.strip():
+        parts.append(f"Clinician's notes:\n{clinician_note.strip()}")
+    for i, segment_facts in enumerate(facts, 1):
+        if segment_facts.strip().rstrip(".").lower() != NO_FACTS.lower():
+            parts.append(f"Document part {i} of {len(facts)}:\n{segment_facts}")
+    return "\n\n".join(parts)
@@ -0,0 +1,98 @@
+"""Read-only, memory-mapped storage for a built DSM-5 index.
+
+The FAISS index is opened with FAISS's mmap IO flags and chunk texts are
+sliced out of a single mapped file by offset, so every process that opens
+the same index directory reads the same pages through the OS page cache.
+Only the small per-chunk metadata list is held in Python objects.
+"""
+import json
+import mmap
+import os
+
+VECTOR_FILE = "vectors.faiss"
+CHUNK_TEXT_FILE = "chunks.bin"
+CHUNK_OFFSETS_FILE = "chunks.offsets.npy"
+CHUNK_METADATA_FILE = "chunks.meta.json"
+
+
+def save_mapped_index(path, index, documents):
+    """Write the FAISS index and the chunk texts/metadata into directory ``path``"""
+    import faiss
+    import numpy as np
+
+    faiss.write_index(index, os.path.join(path, VECTOR_FILE))
+    offsets = [0]
+    with open(os.path.join(path, CHUNK_TEXT_FILE), 'wb') as file:
+        for document in documents:
+            data = document.page_content.encode("utf-8")
+            file.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(os.path.join(path, CHUNK_OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(path, CHUNK_METADATA_FILE), 'w', encoding='utf-8') as file:
+        json.dump([document.metadata for document in documents], file)
+
+
+def has_mapped_index(path):
+    return all(os.path.exists(os.path.join(path, name))
+               for name in (VECTOR_FILE, CHUNK_TEXT_FILE, CHUNK_OFFSETS_FILE, CHUNK_METADATA_FILE))
+
+
+class MappedDocstore:
+    """LangChain docstore that decodes chunk texts from a memory-mapped file on demand.
+
+    Ids are FAISS positions (int or numeric str). Nothing but the metadata
+    list is copied into the process; texts are decoded per lookup.
+    """
+
+    def __init__(self, path):
+        import numpy as np
+
+        self._offsets = np.load(os.path.join(path, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(path, CHUNK_METADATA_FILE), 'r', encoding='utf-8') as file:
+            self._metadatas = json.load(file)
+        with open(os.path.join(path, CHUNK_TEXT_FILE), 'rb') as file:
+            # mmap cannot map an empty file
+            self._text = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    def __len__(self):
+        return len(self._metadatas)
+
+    def text(self, doc_id):
+        doc_id = int(doc_id)
+        start, end = int(self._offsets[doc_id]), int(self._offsets[doc_id + 1])
+        return self._text[start:end].decode("utf-8")
+
+    def metadata(self, doc_id):
+        return self._metadatas[int(doc_id)]
+
+    def search(self, search):
+        from langchain.schema import Document
+
+        try:
+            doc_id = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= doc_id < len(self):
+            return f"ID {search} not found."
+        return Document(page_content=self.text(doc_id), metadata=dict(self.metadata(doc_id)))
+
+    def delete(self, ids):
+        raise NotImplementedError("Mapped indexes are read-only")
+
+
+def load_mapped_index(path, embeddings):
+    """Open a saved index read-only as a LangChain FAISS vectorstore backed by mapped files"""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    # IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat, HNSW, SQ and IVF codes without copying them;
+    # plain IO_FLAG_MMAP only maps inverted lists and copies flat codes into the heap
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    index = faiss.read_index(os.path.join(path, VECTOR_FILE), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    docstore = MappedDocstore(path)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id={i: i for i in range(len(docstore))},
+    )
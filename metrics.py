@@ -0,0 +1,237 @@
+"""Per-stage latency and token-usage metrics with rolling aggregates and Prometheus export"""
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# METRICS_ENABLED=0 turns every hook into a no-op
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Samples kept per stage for the rolling percentiles
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", "500"))
+# Prometheus text file rewritten every METRICS_FLUSH_INTERVAL seconds (e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.environ.get("METRICS_FILE", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "15"))
+# Serve the same text at http://<host>:METRICS_PORT/metrics
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRIC_PREFIX = "mental_note"
+TOKEN_RATE_WINDOW = 60.0
+
+
+class _NullStage:
+    """Stand-in context manager used when metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _StageTimer:
+    def __init__(self, registry, name, timings):
+        self.registry = registry
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.registry.observe(self.name, elapsed)
+        if self.timings is not None:
+            stages = self.timings.setdefault("stages", {})
+            stages[self.name] = stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+class MetricsRegistry:
+    """Rolling stage latencies, token counters and cache hit counts for this process"""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+        self._counters = {}
+        self._token_events = deque()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            count, total = self._totals.get(stage, (0, 0.0))
+            self._totals[stage] = (count + 1, total + seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_tokens(self, prompt_tokens, completion_tokens, cached_tokens=0):
+        now = time.monotonic()
+        with self._lock:
+            self._token_events.append((now, prompt_tokens + completion_tokens))
+        self.increment("tokens_total", prompt_tokens, type="prompt")
+        self.increment("tokens_total", completion_tokens, type="completion")
+        if cached_tokens:
+            self.increment("tokens_total", cached_tokens, type="cached_prompt")
+
+    def tokens_per_minute(self):
+        cutoff = time.monotonic() - TOKEN_RATE_WINDOW
+        with self._lock:
+            while self._token_events and self._token_events[0][0] < cutoff:
+                self._token_events.popleft()
+            return sum(tokens for _, tokens in self._token_events) * 60.0 / TOKEN_RATE_WINDOW
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def hit_rate(self, cache):
+        hits = self.counter("cache_requests_total", cache=cache, result="hit")
+        misses = self.counter("cache_requests_total", cache=cache, result="miss")
+        return hits / (hits + misses) if hits + misses else None
+
+    def snapshot(self):
+        """{"stages": {stage: {count, p50, p95, mean}}, "tokens_per_minute", "hit_rates"} over the window"""
+        with self._lock:
+            windows = {stage: sorted(samples) for stage, samples in self._samples.items()}
+            caches = sorted({dict(labels)["cache"] for name, labels in self._counters if name == "cache_requests_total"})
+        stages = {
+            stage: {
+                "count": len(ordered),
+                "p50": _percentile(ordered, 0.50),
+                "p95": _percentile(ordered, 0.95),
+                "mean": sum(ordered) / len(ordered),
+            }
+            for stage, ordered in windows.items() if ordered
+        }
+        return {
+            "stages": stages,
+            "tokens_per_minute": self.tokens_per_minute(),
+            "hit_rates": {cache: self.hit_rate(cache) for cache in caches},
+        }
+
+    def prometheus_text(self):
+        """Current metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        with self._lock:
+            totals = dict(self._totals)
+            counters = dict(self._counters)
+        lines = [f"# HELP {METRIC_PREFIX}_stage_seconds Latency of each pipeline stage over the rolling window",
+                 f"# TYPE {METRIC_PREFIX}_stage_seconds summary"]
+        for stage, stats in sorted(snapshot["stages"].items()):
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+                lines.append(f'{METRIC_PREFIX}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {stats[key]:.6f}')
+            count, total = totals[stage]
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {count}')
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_tokens_per_minute gauge")
+        lines.append(f"{METRIC_PREFIX}_tokens_per_minute {snapshot['tokens_per_minute']:.1f}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """Atomically replace ``path`` with the current Prometheus text"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+def _start_file_flusher(registry, path, interval):
+    def flush_forever():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.write_file(path)
+            except OSError:
+                pass
+
+    threading.Thread(target=flush_forever, name="metrics-flush", daemon=True).start()
+
+
+def _start_http_exporter(registry, port):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+_shared_metrics = None
+_shared_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide registry, starting the configured exporters on first use"""
+    global _shared_metrics
+    with _shared_metrics_lock:
+        if _shared_metrics is None:
+            _shared_metrics = MetricsRegistry()
+            if METRICS_ENABLED and METRICS_FILE:
+                _start_file_flusher(_shared_metrics, METRICS_FILE, METRICS_FLUSH_INTERVAL)
+            if METRICS_ENABLED and METRICS_PORT:
+                _start_http_exporter(_shared_metrics, METRICS_PORT)
+        return _shared_metrics
+
+
+def stage(name, timings=None):
+    """Time a ``with`` block as stage ``name``, adding it to timings["stages"] too if given"""
+    if not METRICS_ENABLED:
+        return _NULL_STAGE
+    return _StageTimer(get_metrics(), name, timings)
+
+
+def record_usage(usage, timings=None):
+    """Count an OpenAI ``usage`` object and add its token counts to timings["usage"]"""
+    if not METRICS_ENABLED or usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    get_metrics().record_tokens(usage.prompt_tokens, usage.completion_tokens, cached_tokens)
+    if timings is not None:
+        # Summed, so a note generated by several requests reports its total
+        totals = timings.setdefault("usage", {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        totals["prompt_tokens"] += usage.prompt_tokens
+        totals["completion_tokens"] += usage.completion_tokens
+        totals["cached_tokens"] += cached_tokens
+
+
+def record_cache(cache, hit):
+    """Count one lookup in the named cache"""
+    if METRICS_ENABLED:
+        get_metrics().increment("cache_requests_total", cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,168 @@
+"""Note history in SQLite with paging and full-text search.
+
+Every note belongs to an owner, and every read is filtered on it, so one
+server-wide database never shows a clinician's notes to anyone else. Only
+signed-in users' notes go to that database; a NoteHistory opened on
+SESSION_HISTORY_PATH keeps a visitor's notes in memory for their session.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+
+NOTE_HISTORY_PATH = os.environ.get("NOTE_HISTORY_PATH", os.path.join(".cache", "note_history.sqlite"))
+# An in-memory database, gone when the NoteHistory holding it is
+SESSION_HISTORY_PATH = ":memory:"
+DIAGNOSIS_PREVIEW_CHARS = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL,
+    output_style TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    raw_note TEXT NOT NULL,
+    transformed_note TEXT NOT NULL,
+    timings TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS notes_diagnosis ON notes (diagnosis);
+"""
+# Created after the owner column is migrated in, for databases that predate it
+_OWNER_SCHEMA = """
+DROP INDEX IF EXISTS notes_timestamp;
+DROP INDEX IF EXISTS notes_style;
+CREATE INDEX IF NOT EXISTS notes_owner ON notes (owner, timestamp);
+CREATE INDEX IF NOT EXISTS notes_owner_style ON notes (owner, output_style, timestamp);
+"""
+
+# External-content FTS5 index kept in sync with the notes table by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    raw_note, transformed_note, content='notes', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS notes_ai AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts (rowid, raw_note, transformed_note)
+    VALUES (new.id, new.raw_note, new.transformed_note);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_ad AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, raw_note, transformed_note)
+    VALUES ('delete', old.id, old.raw_note, old.transformed_note);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_au AFTER UPDATE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, raw_note, transformed_note)
+    VALUES ('delete', old.id, old.raw_note, old.transformed_note);
+    INSERT INTO notes_fts (rowid, raw_note, transformed_note)
+    VALUES (new.id, new.raw_note, new.transformed_note);
+END;
+"""
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching notes that contain every word"""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"' for word in words)
+
+
+class NoteHistory:
+    """Transformed notes stored in SQLite; list views never load note bodies"""
+
+    def __init__(self, path=NOTE_HISTORY_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(notes)")}
+        if "owner" not in columns:
+            # Notes saved before history was scoped have no owner and stay hidden from everyone
+            self._conn.execute("ALTER TABLE notes ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._conn.executescript(_OWNER_SCHEMA)
+        try:
+            self._conn.executescript(_FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE scans
+            self.full_text = False
+        self._conn.commit()
+
+    def add(self, owner, timestamp, raw_note, diagnosis, output_style, transformed_note, timings=None):
+        """Insert a note for ``owner`` and return its id"""
+        if not owner:
+            raise ValueError("A note history owner is required")
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO notes (owner, timestamp, output_style, diagnosis, raw_note, transformed_note, timings)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (owner, timestamp, output_style, diagnosis, raw_note, transformed_note, json.dumps(timings or {}))
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _where(self, owner, search, output_style):
+        # An empty owner matches nothing rather than the unowned legacy rows
+        clauses = ["owner = ?", "owner != ''"]
+        params = [owner or ""]
+        if search and fts_query(search):
+            if self.full_text:
+                clauses.append("id IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)")
+                params.append(fts_query(search))
+            else:
+                clauses.append("(raw_note LIKE ? OR transformed_note LIKE ?)")
+                params.extend([f"%{search}%", f"%{search}%"])
+        if output_style:
+            clauses.append("output_style = ?")
+            params.append(output_style)
+        return " WHERE " + " AND ".join(clauses), params
+
+    def count(self, owner, search=None, output_style=None):
+        """Number of ``owner``'s notes matching the search and style filter"""
+        where, params = self._where(owner, search, output_style)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM notes{where}", params).fetchone()[0]
+
+    def page(self, owner, offset, limit, search=None, output_style=None):
+        """Newest-first summaries (id, timestamp, output_style, diagnosis preview) of ``owner``'s notes"""
+        where, params = self._where(owner, search, output_style)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, timestamp, output_style, substr(diagnosis, 1, {DIAGNOSIS_PREVIEW_CHARS}) AS diagnosis"
+                f" FROM notes{where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, owner, note_id):
+        """Full note entry, or None if it does not exist or belongs to someone else"""
+        where, params = self._where(owner, None, None)
+        with self._lock:
+            row = self._conn.execute(f"SELECT * FROM notes{where} AND id = ?", params + [note_id]).fetchone()
+        if row is None:
+            return None
+        note = dict(row)
+        note["timings"] = json.loads(note["timings"])
+        return note
+
+    def delete(self, owner, note_id):
+        """Remove one of ``owner``'s notes; return False if it does not exist or belongs to someone else"""
+        where, params = self._where(owner, None, None)
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM notes{where} AND id = ?", params + [note_id])
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+
+_shared_history = None
+_shared_history_lock = threading.Lock()
+
+
+def get_note_history():
+    """Return the process-wide, on-disk note history store"""
+    global _shared_history
+    with _shared_history_lock:
+        if _shared_history is None:
+            _shared_history = NoteHistory()
+        return _shared_history
@@ -0,0 +1,292 @@
+"""Prompt assembly for clinical note transformation, shared by the app and batch runner"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+NOTE_MODEL = "gpt-4.1-mini-2025-04-14"
+NOTE_TEMPERATURE = 0.3
+OUTPUT_STYLES = ["SOAP", "DAP", "Standard"]
+
+# Prompt tokens allowed per request; DSM-5 context is trimmed to fit what the note leaves over
+NOTE_INPUT_TOKEN_BUDGET = int(os.environ.get("NOTE_INPUT_TOKEN_BUDGET", "6000"))
+# Output budget: a per-style base plus a multiple of the note length, clamped to these bounds.
+# The floor leaves room for every section, ICD-10-CM codes and DSM-5 justification on a short note;
+# a reply cut off at its budget is retried once at the maximum (see widen_output_budget)
+NOTE_MIN_OUTPUT_TOKENS = 1200
+NOTE_MAX_OUTPUT_TOKENS = int(os.environ.get("NOTE_MAX_OUTPUT_TOKENS", "4000"))
+OUTPUT_TOKENS_PER_NOTE_TOKEN = 1.5
+# finish_reason of a completion that stopped at max_tokens
+TRUNCATED_FINISH_REASON = "length"
+# Shortest suffix/prefix match treated as splitter overlap between two DSM chunks
+MIN_CHUNK_OVERLAP = 40
+# A chunk cut shorter than this is more noise than context
+MIN_TRUNCATED_CHUNK_TOKENS = 50
+DSM_SECTION_HEADER = "Relevant DSM-5 Information:\n"
+
+# Everything up to the format section is identical for every request and
+# kept first. It is only ~500 tokens, below OpenAI's 1024-token minimum for
+# prompt caching, so it is reused from the cache only when what follows
+# (DSM-5 context, a long note) brings the shared prefix past that minimum
+SHARED_INSTRUCTIONS = """Purpose:
+Transform raw, unstructured clinical notes into structured, comprehensive clinical notes following a standard clinical documentation format. The completed notes should maintain all essential content from the raw notes while organizing the information under clear sections and integrating therapeutic interventions and outcomes.
+
+Instructions:
+
+Input Structure:
+You will receive a block of raw clinical notes that consist of unstructured, fragmented statements capturing the client's experiences, symptoms, emotional states, and any therapeutic interventions. The clinician may also provide a preliminary diagnosis, along with relevant excerpts from the DSM-5.
+
+If a diagnosis is included, use it to:
+- Identify the corresponding DSM-5 classification and ICD-10-CM code.
+- Locate and highlight supporting content from the raw note that justifies the diagnosis.
+
+Transformation Guidelines:
+- Maintain all factual content from the raw notes. Do not omit or alter any reported information.
+- Organize the content logically, ensuring a clear flow of information based on the chosen format.
+- Reframe emotional expressions into clinically appropriate language without diminishing the client's emotional experiences.
+- Include specific numeric data, such as distress levels or duration of symptoms, in the relevant sections.
+- Document therapeutic interventions explicitly, specifying the technique used and observed outcomes.
+- Link clinical symptoms explicitly to the provided diagnosis where applicable, referencing the DSM-5 and ICD-10-CM.
+
+Tone and Style:
+- Use neutral, professional, and clinical language.
+- Avoid subjective interpretations or assumptions not stated in the raw notes. Avoid generating new information not stated in the raw notes. For sections not described in the raw notes, it is fine to leave them blank.
+- Ensure clarity and coherence, making the document accessible for clinical review and continuity of care.
+
+Output Structure:
+"""
+
+# Per style: heading line and (section, description) pairs
+FORMAT_SECTIONS = {
+    "SOAP": ("SOAP (Subjective, Objective, Assessment, Plan) format:", [
+        ("Subjective", "Client's reported experiences and emotional states."),
+        ("Objective", "Observable behaviors, symptoms, and therapist observations."),
+        ("Assessment", "Clinical interpretations and diagnostic impressions."),
+        ("Plan", "Interventions, goals, and follow-up actions."),
+    ]),
+    "DAP": ("DAP (Data, Assessment, Plan) format:", [
+        ("Data", "Information shared by the client and observed in session."),
+        ("Assessment", "Clinical impressions and interpretation."),
+        ("Plan", "Future therapeutic focus and recommendations."),
+    ]),
+    "Standard": ("Standard format:", [
+        ("Presenting Problem", ""),
+        ("Background/History", ""),
+        ("Session Content", ""),
+        ("Interventions and Outcomes", ""),
+        ("Coping Strategies", ""),
+        ("Recommendations and Follow-Up", ""),
+    ]),
+}
+# Tokens for headings, ICD-10-CM codes and diagnostic justification, before scaling with the note
+OUTPUT_BASE_TOKENS = {"SOAP": 1000, "DAP": 900, "Standard": 1200}
+# Per-section generation: a section may use up to this multiple of its even share of the note's output budget
+SECTION_OUTPUT_SHARE = 2.0
+NOTE_MIN_SECTION_OUTPUT_TOKENS = 400
+SECTION_INSTRUCTION = (
+    'Write only the {name} section of the {style} note, starting with the heading "{name}:". '
+    "The other sections are being written separately, so do not include them, an introduction or closing remarks."
+)
+
+NotePrompt = namedtuple("NotePrompt", ["messages", "max_tokens", "token_counts", "dsm_chunks"])
+
+
+class NoteTruncatedError(RuntimeError):
+    """The model stopped at max_tokens: the note is incomplete and must not be cached or saved"""
+
+    def __init__(self, max_tokens, what="the note", remedy="raise NOTE_MAX_OUTPUT_TOKENS or shorten the input"):
+        super().__init__(f"{what} was cut off at the {max_tokens}-token output limit ({remedy})")
+        self.max_tokens = max_tokens
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(NOTE_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken is missing or cannot fetch its vocabulary offline
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """Count tokens with the model's tokenizer, or estimate ~4 characters per token without tiktoken"""
+    encoding = _get_encoding()
+    if not encoding:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens, preferring to end on a sentence boundary"""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        text = encoding.decode(tokens[:max_tokens])
+    elif len(text) > max_tokens * 4:
+        text = text[:max_tokens * 4]
+    else:
+        return text
+    sentence_end = text.rfind(". ")
+    if sentence_end > len(text) // 2:
+        text = text[:sentence_end + 1]
+    return text
+
+
+def split_to_tokens(text, max_tokens):
+    """Cut text into consecutive pieces of at most max_tokens each"""
+    encoding = _get_encoding()
+    if not encoding:
+        step = max_tokens * 4
+        return [text[start:start + step] for start in range(0, len(text), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+def format_section_text(output_style):
+    """The style-specific tail of the system prompt"""
+    heading, sections = FORMAT_SECTIONS[output_style]
+    lines = [heading]
+    for name, description in sections:
+        lines.append(f"- {name}: {description}" if description else f"- {name}")
+    return "\n".join(lines)
+
+
+def dedupe_chunks(chunks):
+    """Drop repeated chunks and strip text a chunk shares with one already kept.
+
+    Neighbouring DSM chunks overlap by up to the splitter's chunk_overlap;
+    only the new part of each later chunk is kept.
+    """
+    kept = []
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if not chunk or any(chunk in other for other in kept):
+            continue
+        for other in kept:
+            # Longest prefix of this chunk that is a suffix of one already kept
+            for size in range(min(len(other), len(chunk)) - 1, MIN_CHUNK_OVERLAP - 1, -1):
+                if other.endswith(chunk[:size]):
+                    chunk = chunk[size:].strip()
+                    break
+        if chunk:
+            kept.append(chunk)
+    return kept
+
+
+def fit_chunks_to_budget(chunks, budget):
+    """Keep chunks in rank order until the token budget runs out, truncating the last one"""
+    fitted = []
+    for chunk in chunks:
+        if budget <= 0:
+            break
+        tokens = count_tokens(chunk)
+        if tokens > budget:
+            if budget < MIN_TRUNCATED_CHUNK_TOKENS:
+                break
+            chunk = truncate_to_tokens(chunk, budget)
+            tokens = count_tokens(chunk)
+        fitted.append(chunk)
+        budget -= tokens + 2  # blank line separating chunks
+    return fitted
+
+
+def output_token_budget(output_style, note_tokens):
+    """max_tokens for a note of the given length"""
+    budget = OUTPUT_BASE_TOKENS[output_style] + int(OUTPUT_TOKENS_PER_NOTE_TOKEN * note_tokens)
+    return max(NOTE_MIN_OUTPUT_TOKENS, min(NOTE_MAX_OUTPUT_TOKENS, budget))
+
+
+def widen_output_budget(prompt):
+    """The prompt with the largest output budget for a retry after truncation, or None if it already had it"""
+    if prompt.max_tokens >= NOTE_MAX_OUTPUT_TOKENS:
+        return None
+    return prompt._replace(max_tokens=NOTE_MAX_OUTPUT_TOKENS)
+
+
+def _user_prompt(raw_note, diagnosis, output_style, dsm_text):
+    dsm_section = f"{DSM_SECTION_HEADER}{dsm_text}\n\n" if dsm_text else ""
+    return f"""{dsm_section}Clinician's Diagnosis:
+{diagnosis}
+
+Raw Clinical Notes:
+{raw_note}
+
+Please transform this information into a structured {output_style} note format following the comprehensive guidelines provided. Ensure all content from the raw notes is preserved and organized appropriately. Use the relevant DSM-5 information to enhance diagnostic accuracy and provide appropriate ICD-10-CM codes."""
+
+
+def assemble_note_prompt(raw_note, diagnosis, output_style, dsm_chunks=(), input_budget=NOTE_INPUT_TOKEN_BUDGET):
+    """Build the messages and token budgets for transforming a raw note.
+
+    ``dsm_chunks`` are retrieved DSM-5 texts in rank order. They are
+    de-duplicated and trimmed to whatever the input budget leaves after the
+    instructions and the note itself; the note is never trimmed.
+    """
+    system_prompt = SHARED_INSTRUCTIONS + format_section_text(output_style)
+    base_user_prompt = _user_prompt(raw_note, diagnosis, output_style, "")
+    system_tokens = count_tokens(system_prompt)
+    note_tokens = count_tokens(raw_note)
+    base_user_tokens = count_tokens(base_user_prompt)
+
+    dsm_budget = input_budget - system_tokens - base_user_tokens - count_tokens(DSM_SECTION_HEADER) - 2
+    kept_chunks = fit_chunks_to_budget(dedupe_chunks(dsm_chunks), dsm_budget)
+    dsm_text = "\n\n".join(kept_chunks)
+    user_prompt = _user_prompt(raw_note, diagnosis, output_style, dsm_text) if dsm_text else base_user_prompt
+    user_tokens = count_tokens(user_prompt)
+
+    token_counts = {
+        "system": system_tokens,
+        "note": note_tokens,
+        "dsm": user_tokens - base_user_tokens,
+        "input": system_tokens + user_tokens,
+    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    return NotePrompt(messages, output_token_budget(output_style, note_tokens), token_counts, kept_chunks)
+
+
+def assemble_section_prompts(raw_note, diagnosis, output_style, dsm_chunks=(), input_budget=NOTE_INPUT_TOKEN_BUDGET):
+    """One (section, NotePrompt) per section of the output style, in note order.
+
+    Every prompt is the single-note prompt followed by a short instruction
+    naming its section, so the requests share one prefix; once that prefix
+    passes OpenAI's 1024-token caching minimum (typically with DSM-5
+    context), the parallel calls and single-shot requests for the same
+    note can reuse it.
+    """
+    base = assemble_note_prompt(raw_note, diagnosis, output_style, dsm_chunks, input_budget)
+    _, sections = FORMAT_SECTIONS[output_style]
+    max_tokens = int(base.max_tokens * SECTION_OUTPUT_SHARE / len(sections))
+    max_tokens = max(NOTE_MIN_SECTION_OUTPUT_TOKENS, min(base.max_tokens, max_tokens))
+    prompts = []
+    for name, _ in sections:
+        instruction = SECTION_INSTRUCTION.format(name=name, style=output_style)
+        token_counts = dict(base.token_counts, input=base.token_counts["input"] + count_tokens(instruction))
+        messages = base.messages + [{"role": "user", "content": instruction}]
+        prompts.append((name, NotePrompt(messages, max_tokens, token_counts, base.dsm_chunks)))
+    return prompts
+
+
+def _prompt_version():
+    template = [
+        SHARED_INSTRUCTIONS, FORMAT_SECTIONS, SECTION_INSTRUCTION, DSM_SECTION_HEADER,
+        _user_prompt("{raw_note}", "{diagnosis}", "{output_style}", "{dsm_text}"),
+        NOTE_INPUT_TOKEN_BUDGET, NOTE_MIN_OUTPUT_TOKENS, NOTE_MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_NOTE_TOKEN,
+        OUTPUT_BASE_TOKENS, SECTION_OUTPUT_SHARE, NOTE_MIN_SECTION_OUTPUT_TOKENS,
+    ]
+    return hashlib.sha256(json.dumps(template, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# Changes whenever the prompt wording or the output budgets do, so cached notes from an older prompt are not served
+NOTE_PROMPT_VERSION = _prompt_version()
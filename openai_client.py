@@ -0,0 +1,119 @@
+"""Process-wide OpenAI client factory with pooled connections, timeouts and retry policy"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+# Point at a local OpenAI-compatible stub server for tests and benchmarks
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.environ.get("OPENAI_READ_TIMEOUT", "60"))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "32"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _timeout():
+    return httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def _limits():
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE)
+
+
+def get_openai_client(api_key, base_url=None):
+    """Return the shared synchronous client for this key and endpoint.
+
+    The client keeps a pool of keep-alive connections, so sessions and
+    threads reuse TLS connections instead of handshaking per request.
+    Retries are left to call_with_retries() so every path backs off the
+    same way.
+    """
+    base_url = base_url or OPENAI_BASE_URL
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=_timeout(),
+                max_retries=0,
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+            _clients[key] = client
+        return client
+
+
+def make_async_openai_client(api_key, base_url=None):
+    """Create an async client with the shared pool, timeout and retry settings.
+
+    Async connection pools are bound to the event loop that opened them,
+    so each asyncio.run() (e.g. one batch run) gets its own client and
+    should close it when done.
+    """
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url or OPENAI_BASE_URL,
+        timeout=_timeout(),
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+    )
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retry ``attempt`` (0-based): Retry-After if sent, else jittered backoff"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(RETRY_MAX_DELAY, float(response.headers.get("retry-after")))
+        except (TypeError, ValueError):
+            pass
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+
+def call_with_retries(fn, *args, max_retries=OPENAI_MAX_RETRIES, on_retry=None, **kwargs):
+    """Call fn(*args, **kwargs), retrying transient OpenAI errors with backoff"""
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            if on_retry:
+                on_retry(e)
+            time.sleep(retry_delay(e, attempt))
+            attempt += 1
+
+
+async def call_with_retries_async(fn, *args, max_retries=OPENAI_MAX_RETRIES, on_retry=None, **kwargs):
+    """Async counterpart of call_with_retries() for coroutine functions"""
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            if on_retry:
+                on_retry(e)
+            await asyncio.sleep(retry_delay(e, attempt))
+            attempt += 1
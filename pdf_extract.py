@@ -0,0 +1,65 @@
+"""Page-streaming PDF extraction; PyPDF2 is imported on first use"""
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages a process pool costs more than it saves (spawned workers start a fresh interpreter)
+PARALLEL_MIN_PAGES = 128
+PAGES_PER_TASK = 8
+# Pools are started from server threads (the KB build, Streamlit script runs); forking a
+# multi-threaded process can deadlock a child on a lock held by another thread
+PDF_EXTRACT_START_METHOD = "spawn"
+
+_worker_reader = None
+
+
+def _open_reader(source):
+    # Imported here so the app's first paint does not wait for PyPDF2
+    import PyPDF2
+
+    if isinstance(source, (bytes, bytearray)):
+        return PyPDF2.PdfReader(io.BytesIO(source))
+    return PyPDF2.PdfReader(source)
+
+
+def _init_worker(source):
+    global _worker_reader
+    _worker_reader = _open_reader(source)
+
+
+def _extract_page_range(start, stop):
+    return [(i + 1, _worker_reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def count_pdf_pages(source):
+    """Number of pages in a PDF path or bytes, without extracting any text"""
+    return len(_open_reader(source).pages)
+
+
+def iter_pdf_pages(source, workers=PDF_EXTRACT_WORKERS):
+    """Yield (page_no, text) for each page in order, page numbers starting at 1.
+
+    ``source`` is a path, raw bytes or a file-like object such as a
+    Streamlit upload. Large documents are extracted across a pool of
+    spawned processes, each worker opening its own reader and handling a
+    range of pages.
+    """
+    if hasattr(source, "read"):
+        source = source.read()
+    reader = _open_reader(source)
+    page_count = len(reader.pages)
+
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page.extract_text() or ""
+        return
+
+    starts = list(range(0, page_count, PAGES_PER_TASK))
+    stops = [min(start + PAGES_PER_TASK, page_count) for start in starts]
+    with ProcessPoolExecutor(max_workers=min(workers, len(starts)),
+                             mp_context=multiprocessing.get_context(PDF_EXTRACT_START_METHOD),
+                             initializer=_init_worker, initargs=(source,)) as pool:
+        for pages in pool.map(_extract_page_range, starts, stops):
+            yield from pages
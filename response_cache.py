@@ -0,0 +1,104 @@
+"""Deterministic cache for note transformations: in-memory LRU over a TTL-bounded SQLite store"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", os.path.join(".cache", "responses.sqlite"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MEMORY_ENTRIES = 256
+
+
+def response_cache_key(raw_note, diagnosis, output_style, model, temperature, dsm_context, prompt_version, mode=None):
+    """Hash every input that determines the model's response.
+
+    ``prompt_version`` identifies the prompt template and output budgets
+    (note_transform.NOTE_PROMPT_VERSION); ``mode`` separates alternative
+    generation paths.
+    """
+    inputs = [raw_note, diagnosis, output_style, model, temperature, dsm_context, prompt_version]
+    if mode:
+        inputs.append(mode)
+    blob = json.dumps(inputs)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU of recent responses in front of an on-disk store; entries expire after ``ttl`` seconds.
+
+    A ttl of 0 keeps responses in memory only for the lifetime of the
+    process and never writes them to disk.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL,
+                 max_memory_entries=RESPONSE_CACHE_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.stats = {"hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path and ttl > 0:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, created REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            self._conn.commit()
+
+    def _expired(self, created):
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _remember(self, key, created, response):
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached response for key, or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT created, response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    self._remember(key, row[0], row[1])
+                    self.stats["hits"] += 1
+                    return row[1]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, response):
+        """Store a response under key"""
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, response)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, created, response))
+                self._conn.commit()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
@@ -0,0 +1,41 @@
+"""Retrieval settings chosen by the offline tuning harness (python -m bench.tune).
+
+The file is optional: without it the built-in defaults apply. Environment
+variables such as DSM_EMBEDDING_BACKEND and DSM_INDEX_TYPE still take
+precedence over it.
+"""
+import json
+import os
+from datetime import datetime
+
+RETRIEVAL_CONFIG_PATH = os.environ.get("DSM_RETRIEVAL_CONFIG", "retrieval_config.json")
+DEFAULT_RETRIEVAL_CONFIG = {
+    "chunk_size": 1000,
+    "chunk_overlap": 200,
+    "embedding_backend": "openai",
+    "index_type": "flat",
+    "top_k": 3,
+}
+
+
+def load_retrieval_config(path=RETRIEVAL_CONFIG_PATH):
+    """The defaults, overridden by any settings saved in ``path``"""
+    config = dict(DEFAULT_RETRIEVAL_CONFIG)
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            saved = json.load(file)
+        config.update({key: saved[key] for key in DEFAULT_RETRIEVAL_CONFIG if key in saved})
+    return config
+
+
+def save_retrieval_config(settings, path=RETRIEVAL_CONFIG_PATH, evaluation=None):
+    """Write the chosen settings, and optionally how they scored, where load_retrieval_config() reads them"""
+    data = {key: settings[key] for key in DEFAULT_RETRIEVAL_CONFIG}
+    data["tuned"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if evaluation:
+        data["evaluation"] = evaluation
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2)
+        file.write("\n")
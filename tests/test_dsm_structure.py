@@ -0,0 +1,119 @@
+import pytest
+
+from dsm_structure import (clean_page_lines, code_keys, find_icd10_codes, is_heading, is_section_heading,
+                           iter_dsm_chunks, name_keys, normalize_diagnosis)
+
+# Two pages shaped like the bundled table of contents, running headers included
+PAGES = [
+    (12, "12 • DSM-5 Table of ContentsAnxiety Disorders\n"
+         "Separation Anxiety Disorder\n"
+         "Diagnostic criteria: excessive fear concerning separation from home (F93.0).\n"
+         "Generalized Anxiety Disorder\n"
+         "Excessive anxiety and worry occurring more days than not for at least 6 months (F41.1).\n"
+         "12\n"),
+    (13, "DSM-5 Table of Contents • 13\n"
+         "Depressive Disorders\n"
+         "Persistent Depressive Disorder (Dysthymia)\n"
+         "Depressed mood for most of the day, for at least 2 years (F34.1).\n"),
+]
+
+
+@pytest.mark.parametrize("line", [
+    "Generalized Anxiety Disorder",
+    "Attention-Deficit/Hyperactivity Disorder",
+    "Persistent Depressive Disorder (Dysthymia)",
+    "Disorder Due to Another Medical Condition",
+    "Section II: Diagnostic Criteria and Codes",
+    "Major Depressive Disorder, Single and Recurrent Episodes",
+])
+def test_is_heading_accepts_title_case_names(line):
+    assert is_heading(line)
+
+
+@pytest.mark.parametrize("line", [
+    "Excessive anxiety and worry occurring more days than not.",
+    "the client reports poor sleep",
+    "Diagnostic Criteria",
+    "Specify If",
+    "Coding Note",
+    "A" + " Word" * 20,
+])
+def test_is_heading_rejects_prose_and_criteria_labels(line):
+    assert not is_heading(line)
+
+
+def test_section_headings():
+    assert is_section_heading("Anxiety Disorders")
+    assert is_section_heading("Sexual Dysfunctions")
+    assert is_section_heading("Section III: Emerging Measures and Models")
+    assert not is_section_heading("Generalized Anxiety Disorder")
+
+
+def test_clean_page_lines_strips_running_headers_and_page_numbers():
+    lines = clean_page_lines("8 • DSM-5 Table of ContentsOther Personality Disorders\nVoyeuristic  Disorder\n 8 \n"
+                             "Persistent — Bereavement")
+    assert lines == ["Other Personality Disorders", "Voyeuristic Disorder", "Persistent - Bereavement"]
+    assert clean_page_lines("DSM-5 Table of Contents • 13\nSchizophrenia") == ["Schizophrenia"]
+
+
+def test_chunks_follow_headings_and_carry_metadata():
+    chunks = list(iter_dsm_chunks(PAGES, chunk_size=120, chunk_overlap=0))
+    by_disorder = {tuple(chunk.metadata["disorders"]): chunk for chunk in chunks}
+
+    gad = by_disorder[("Generalized Anxiety Disorder",)]
+    assert gad.page_content.startswith("Generalized Anxiety Disorder\n")
+    assert "separation" not in gad.page_content
+    assert gad.metadata["section"] == "Anxiety Disorders"
+    assert gad.metadata["icd10_codes"] == ["F41.1"]
+    assert (gad.metadata["page_start"], gad.metadata["page_end"]) == (12, 12)
+
+    dysthymia = by_disorder[("Persistent Depressive Disorder (Dysthymia)",)]
+    assert dysthymia.metadata["section"] == "Depressive Disorders"
+    assert dysthymia.metadata["icd10_codes"] == ["F34.1"]
+    assert dysthymia.metadata["page_start"] == 13
+    assert all("DSM-5 Table of Contents" not in chunk.page_content for chunk in chunks)
+
+
+def test_short_blocks_in_a_section_share_a_chunk_but_sections_do_not():
+    chunks = list(iter_dsm_chunks(PAGES, chunk_size=1000, chunk_overlap=0))
+    assert [chunk.metadata["section"] for chunk in chunks] == ["Anxiety Disorders", "Depressive Disorders"]
+    assert chunks[0].metadata["disorders"] == ["Separation Anxiety Disorder", "Generalized Anxiety Disorder"]
+    assert chunks[0].metadata["icd10_codes"] == ["F93.0", "F41.1"]
+    assert (chunks[0].metadata["page_start"], chunks[0].metadata["page_end"]) == (12, 12)
+
+
+def test_oversized_block_is_split_with_its_heading_repeated():
+    body = "\n".join(f"Criterion {i}: persistent worry about everyday matters for months." for i in range(12))
+    pages = [(40, f"Generalized Anxiety Disorder\n{body}\n"), (41, "More criteria text for the same disorder (F41.1).\n")]
+    chunks = list(iter_dsm_chunks(pages, chunk_size=300, chunk_overlap=50))
+    assert len(chunks) > 2
+    assert all(chunk.page_content.startswith("Generalized Anxiety Disorder\n") for chunk in chunks)
+    assert all(len(chunk.page_content) <= 300 for chunk in chunks)
+    # Codes found anywhere in the block tag every piece of it
+    assert all(chunk.metadata["icd10_codes"] == ["F41.1"] for chunk in chunks)
+    assert chunks[0].metadata["page_start"] == 40
+    assert chunks[-1].metadata["page_end"] == 41
+
+
+def test_find_icd10_codes():
+    assert find_icd10_codes("300.02 (F41.1); f10.20 and Z63.0, unspecified (F99)") == ["F41.1", "F10.20", "Z63.0", "F99"]
+    assert find_icd10_codes("DSM-5 section F and page 41") == []
+
+
+def test_normalize_diagnosis():
+    assert normalize_diagnosis("Tourette's Disorder") == normalize_diagnosis("tourettes  disorder.")
+    assert normalize_diagnosis("F41.1") == "f41.1"
+    assert normalize_diagnosis("Attention-Deficit/Hyperactivity Disorder") == "attention deficit hyperactivity disorder"
+
+
+def test_name_keys_include_trailing_alias_but_not_qualifiers():
+    assert name_keys("Persistent Depressive Disorder (Dysthymia)") == {
+        "persistent depressive disorder dysthymia", "persistent depressive disorder", "dysthymia"}
+    assert "previously phonological disorder" not in name_keys("Speech Sound Disorder (previously Phonological Disorder)")
+    assert code_keys("F41.1") == {"f41.1", "f411"}
+
+
+def test_name_keys_drop_comma_qualifiers():
+    keys = name_keys("Major Depressive Disorder, Single and Recurrent Episodes")
+    assert keys == {"major depressive disorder single and recurrent episodes", "major depressive disorder"}
+    assert "bipolar i disorder" in name_keys("Bipolar I Disorder (Current or Most Recent Episode Manic), Mild")
@@ -0,0 +1,97 @@
+import pytest
+
+from hybrid_retrieval import BM25Index, DiagnosisIndex, diagnosis_query, mmr_select, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "Generalized Anxiety Disorder. Excessive anxiety and worry about a number of events or activities.",
+    "Panic Disorder. Recurrent unexpected panic attacks with palpitations and fear of dying.",
+    "Insomnia Disorder. Difficulty initiating or maintaining sleep, early-morning awakening.",
+    "Anxiety Disorders. Separation anxiety, selective mutism, specific phobia, social anxiety and panic.",
+]
+
+METADATAS = [
+    {"disorders": ["Generalized Anxiety Disorder"], "icd10_codes": ["F41.1"]},
+    {"disorders": ["Persistent Depressive Disorder (Dysthymia)"], "icd10_codes": ["F34.1"]},
+    {"disorders": ["Tourette's Disorder"], "icd10_codes": ["F95.2"]},
+    # A listing such as the table of contents, naming many disorders at once
+    {"disorders": ["Generalized Anxiety Disorder", "Panic Disorder", "Agoraphobia"], "icd10_codes": []},
+]
+
+
+@pytest.fixture
+def diagnosis_index():
+    return DiagnosisIndex.build(enumerate(METADATAS))
+
+
+def test_tokenize_drops_stopwords_and_keeps_codes():
+    assert tokenize("The client reports F41.1 and Panic-attacks") == ["f41.1", "panic", "attacks"]
+
+
+def test_bm25_ranks_the_matching_document_first():
+    index = BM25Index.build(TEXTS)
+    assert index.search("panic attacks palpitations", 4)[0][0] == 1
+    assert index.search("trouble sleeping, early awakening", 4)[0][0] == 2
+    assert index.search("worry", 4)[0][0] == 0
+    assert index.search("nothing relevant here", 4) == []
+
+
+def test_bm25_prefers_rare_terms_and_limits_results():
+    index = BM25Index.build(TEXTS)
+    results = index.search("anxiety palpitations", 2)
+    assert len(results) == 2
+    # "palpitations" occurs in one document, "anxiety" in two
+    assert results[0][0] == 1
+    assert results[0][1] > results[1][1]
+
+
+def test_bm25_round_trips_through_json(tmp_path):
+    index = BM25Index.build(TEXTS)
+    path = tmp_path / "lexical.json"
+    index.save(str(path))
+    assert BM25Index.load(str(path)).search("panic attacks", 4) == index.search("panic attacks", 4)
+
+
+def test_diagnosis_query_uses_only_the_primary_line():
+    assert diagnosis_query("  \nPanic Disorder\nGeneralized Anxiety Disorder") == "Panic Disorder"
+    assert diagnosis_query("") == ""
+
+
+@pytest.mark.parametrize("diagnosis, expected", [
+    ("Generalized Anxiety Disorder", [0, 3]),
+    ("generalized anxiety disorder, moderate", [0, 3]),
+    ("F41.1", [0]),
+    ("300.02 (F41.1) Generalized Anxiety Disorder", [0]),
+    ("f411", [0]),
+    ("Dysthymia", [1]),
+    ("Persistent Depressive Disorder", [1]),
+    ("Tourettes disorder", [2]),
+    ("F95.2 - Tourette's Disorder\nRule out OCD", [2]),
+    ("Agoraphobia", [3]),
+    ("Adjustment disorder", []),
+    ("", []),
+])
+def test_diagnosis_index_lookup(diagnosis_index, diagnosis, expected):
+    assert diagnosis_index.lookup(diagnosis) == expected
+
+
+def test_diagnosis_index_lookup_uses_only_the_primary_line(diagnosis_index):
+    assert diagnosis_index.lookup("Dysthymia\nF41.1") == [1]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 1], [2]], k=60)
+    assert max(fused, key=fused.get) == 2
+    assert fused[3] == pytest.approx(1 / 63)
+    assert reciprocal_rank_fusion([[], []]) == {}
+
+
+def test_mmr_skips_near_duplicates():
+    fused = {0: 1.0, 1: 0.95, 2: 0.8}
+    token_sets = {
+        0: {"worry", "anxiety", "months", "restless"},
+        1: {"worry", "anxiety", "months", "restless", "fatigue"},
+        2: {"panic", "palpitations"},
+    }
+    assert mmr_select(fused, token_sets, 2) == [0, 2]
+    assert mmr_select(fused, token_sets, 2, lambda_=1.0) == [0, 1]
+    assert mmr_select({}, {}, 3) == []
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+import long_document
+from long_document import FACTS_MAX_TOKENS, FACTS_RETRY_MAX_TOKENS, extract_segment_facts, segment_cache_key
+from note_transform import NoteTruncatedError
+from response_cache import ResponseCache
+
+SEGMENT = "Client reports panic attacks twice a week since March.\nTherapist introduced paced breathing."
+
+
+class FakeCompletions:
+    """Answers each create() with the next (content, finish_reason) and records the max_tokens asked for"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.max_tokens = []
+
+    def create(self, **kwargs):
+        self.max_tokens.append(kwargs["max_tokens"])
+        content, finish_reason = self.replies.pop(0)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)],
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=len(content.split()),
+                                  prompt_tokens_details=None))
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    cache = ResponseCache(path=None, ttl=0)
+    monkeypatch.setattr(long_document, "get_response_cache", lambda: cache)
+
+    def install(*replies):
+        completions = FakeCompletions(replies)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        monkeypatch.setattr(long_document, "get_openai_client", lambda api_key: client)
+        return completions, cache
+
+    return install
+
+
+def test_complete_facts_are_cached(fake_openai):
+    completions, cache = fake_openai(("- Panic attacks twice weekly since March", "stop"))
+    facts, usage = extract_segment_facts(SEGMENT, "sk-test")
+    assert facts == "- Panic attacks twice weekly since March"
+    assert usage["prompt_tokens"] == 100
+    assert completions.max_tokens == [FACTS_MAX_TOKENS]
+    assert cache.get(segment_cache_key(SEGMENT)) == facts
+    assert extract_segment_facts(SEGMENT, "sk-test") == (facts, None)
+
+
+def test_truncated_facts_are_retried_with_a_wider_budget(fake_openai):
+    completions, cache = fake_openai(("- Panic attacks twice", "length"),
+                                     ("- Panic attacks twice weekly since March\n- Paced breathing", "stop"))
+    facts, usage = extract_segment_facts(SEGMENT, "sk-test")
+    assert facts.endswith("- Paced breathing")
+    assert completions.max_tokens == [FACTS_MAX_TOKENS, FACTS_RETRY_MAX_TOKENS]
+    assert usage["prompt_tokens"] == 200
+    assert cache.get(segment_cache_key(SEGMENT)) == facts
+
+
+def test_facts_still_truncated_raise_and_are_not_cached(fake_openai):
+    completions, cache = fake_openai(("- Panic", "length"), ("- Panic attacks twice", "length"))
+    with pytest.raises(NoteTruncatedError) as error:
+        extract_segment_facts(SEGMENT, "sk-test")
+    assert error.value.max_tokens == FACTS_RETRY_MAX_TOKENS
+    assert "DOCUMENT_SEGMENT_TOKENS" in str(error.value)
+    assert cache.get(segment_cache_key(SEGMENT)) is None
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from note_history import SESSION_HISTORY_PATH, NoteHistory
+
+# The notes table as it was before history was scoped to an owner
+LEGACY_SCHEMA = """
+CREATE TABLE notes (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    output_style TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    raw_note TEXT NOT NULL,
+    transformed_note TEXT NOT NULL,
+    timings TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX notes_timestamp ON notes (timestamp);
+CREATE INDEX notes_style ON notes (output_style, timestamp);
+"""
+
+
+def add_note(history, owner, minute, style="SOAP", text="client reports worry"):
+    return history.add(owner, f"2026-01-01 10:{minute:02d}:00", text, "GAD", style, f"{style} note: {text}")
+
+
+@pytest.fixture
+def history(tmp_path):
+    return NoteHistory(str(tmp_path / "history.sqlite"))
+
+
+def test_count_page_and_get_only_see_the_owners_notes(history):
+    alice = [add_note(history, "user:alice", minute) for minute in range(3)]
+    bob = add_note(history, "user:bob", 9, style="DAP", text="panic attacks")
+    assert history.count("user:alice") == 3
+    assert history.count("user:bob") == 1
+    assert [note["id"] for note in history.page("user:alice", 0, 10)] == alice[::-1]
+    assert [note["id"] for note in history.page("user:alice", 1, 1)] == [alice[1]]
+    assert history.count("user:alice", search="panic") == 0
+    assert history.count("user:bob", search="panic", output_style="DAP") == 1
+    assert history.get("user:alice", alice[0])["raw_note"] == "client reports worry"
+    assert history.get("user:alice", bob) is None
+    assert history.get("user:bob", bob)["timings"] == {}
+
+
+def test_delete_only_removes_the_owners_notes(history):
+    alice = add_note(history, "user:alice", 1)
+    bob = add_note(history, "user:bob", 2)
+    assert not history.delete("user:alice", bob)
+    assert history.get("user:bob", bob) is not None
+    assert history.delete("user:alice", alice)
+    assert history.get("user:alice", alice) is None
+    assert history.count("user:alice") == 0
+    assert not history.delete("user:alice", alice)
+    # Deleted notes leave the full-text index too
+    assert history.count("user:bob", search="worry") == 1
+
+
+def test_an_owner_is_required(history):
+    with pytest.raises(ValueError):
+        add_note(history, "", 1)
+    assert history.count("") == 0
+    assert history.count(None) == 0
+
+
+def test_legacy_unowned_notes_are_hidden_from_everyone(tmp_path):
+    path = str(tmp_path / "legacy.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO notes (timestamp, output_style, diagnosis, raw_note, transformed_note)"
+                 " VALUES ('2025-12-31 09:00:00', 'SOAP', 'MDD', 'old note', 'old SOAP note')")
+    conn.commit()
+    conn.close()
+
+    history = NoteHistory(path)
+    new = add_note(history, "user:alice", 1)
+    assert history.count("user:alice") == 1
+    assert history.get("user:alice", 1) is None
+    assert [note["id"] for note in history.page("user:alice", 0, 10)] == [new]
+    for owner in ("", None, "user:alice"):
+        assert history.count(owner, search="old") == 0
+        assert not history.delete(owner, 1)
+    # Still on disk, untouched, for an administrator to reassign or remove
+    assert sqlite3.connect(path).execute("SELECT owner FROM notes WHERE id = 1").fetchone() == ("",)
+
+
+def test_session_history_stays_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first, second = NoteHistory(SESSION_HISTORY_PATH), NoteHistory(SESSION_HISTORY_PATH)
+    note = add_note(first, "session", 1)
+    assert first.get("session", note)["transformed_note"] == "SOAP note: client reports worry"
+    assert second.count("session") == 0
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,46 @@
+from note_transform import (NOTE_MAX_OUTPUT_TOKENS, NOTE_MIN_OUTPUT_TOKENS, assemble_note_prompt, count_tokens,
+                            dedupe_chunks, fit_chunks_to_budget, output_token_budget, widen_output_budget)
+
+OVERLAP = "Excessive anxiety and worry occurring more days than not for at least six months."
+
+
+def test_dedupe_chunks_strips_splitter_overlap():
+    first = "Generalized Anxiety Disorder. " + OVERLAP
+    second = OVERLAP + " The individual finds it difficult to control the worry."
+    assert dedupe_chunks([first, second]) == [first, "The individual finds it difficult to control the worry."]
+
+
+def test_dedupe_chunks_drops_repeats_and_contained_chunks():
+    chunk = "Panic Disorder. Recurrent unexpected panic attacks."
+    assert dedupe_chunks([chunk, "  " + chunk, "Recurrent unexpected panic attacks.", "", "Insomnia Disorder."]) == [
+        chunk, "Insomnia Disorder."]
+
+
+def test_dedupe_chunks_keeps_short_coincidental_overlaps():
+    # Shared text shorter than MIN_CHUNK_OVERLAP is not treated as splitter overlap
+    assert dedupe_chunks(["Ends with the word disorder", "disorder starts this one"]) == [
+        "Ends with the word disorder", "disorder starts this one"]
+
+
+def test_fit_chunks_to_budget_keeps_rank_order_and_truncates_the_last():
+    long_chunk = "Sentence about worry and restlessness. " * 200
+    fitted = fit_chunks_to_budget(["First chunk.", long_chunk, "Never reached."], 300)
+    assert fitted[0] == "First chunk."
+    assert len(fitted) == 2
+    assert count_tokens(fitted[1]) <= 300
+    assert fit_chunks_to_budget(["Anything"], 0) == []
+
+
+def test_prompt_never_trims_the_note_and_respects_the_input_budget():
+    note = "Client reports worry. " * 50
+    prompt = assemble_note_prompt(note, "GAD", "SOAP", ["DSM text about anxiety. " * 400], input_budget=1500)
+    assert note in prompt.messages[1]["content"]
+    assert prompt.token_counts["input"] <= 1500 + 10
+
+
+def test_output_budget_bounds_and_widening():
+    assert output_token_budget("SOAP", 0) >= NOTE_MIN_OUTPUT_TOKENS
+    assert output_token_budget("Standard", 10 ** 6) == NOTE_MAX_OUTPUT_TOKENS
+    prompt = assemble_note_prompt("Client anxious.", "GAD", "DAP")
+    assert widen_output_budget(prompt).max_tokens == NOTE_MAX_OUTPUT_TOKENS
+    assert widen_output_budget(widen_output_budget(prompt)) is None